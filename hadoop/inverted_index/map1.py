@@ -2,11 +2,13 @@
 """
 
 Map 1.
-Assign each single word the document id.
+Assign each single word the document id and its frequency in the document.
+term  doc_id  tf
 """
 import sys
 import csv
 import re
+import collections
 
 
 csv.field_size_limit(sys.maxsize)
@@ -25,9 +27,13 @@ def parse_text(doc_id, doc_title, doc_body):
     doc_text = re.sub(r"[^a-zA-Z0-9 ]+", "", doc_text)
     doc_text = doc_text.casefold()
     doc_text_list = doc_text.split()
-    for text in doc_text_list:
-        if text != '' and text not in STOP_WORDS:
-            print(f"{text}\t{doc_id}")
+    # Count each term once per document instead of emitting every occurrence
+    term_freq_per_doc = collections.Counter(
+        text for text in doc_text_list
+        if text != '' and text not in STOP_WORDS
+    )
+    for text, tf_ik in term_freq_per_doc.items():
+        print(f"{text}\t{doc_id}\t{tf_ik}")
 
 
 for line in sys.stdin:
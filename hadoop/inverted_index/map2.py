@@ -2,13 +2,12 @@
 """
 
 Map 2.
-doc_id_1  {"term": term_1, "w_ik": num, "tf_ik": int, "idf_k": num}.
-doc_id_2  {"term": term_2, "w_ik": num, "tf_ik": int, "idf_k": num}.
-doc_id_2  {"term": term_1, "w_ik": num, "tf_ik": int, "idf_k": num}.
-Note that doc_id is not unique.
+doc_id_1  term_1  tf_ik  idf_k
+doc_id_2  term_2  tf_ik  idf_k
+doc_id_2  term_1  tf_ik  idf_k
+Note that doc_id is not unique.  Fields are separated by tabs.
 """
 import sys
-import json
 import math
 
 
@@ -21,18 +20,10 @@ with open(txt_name, 'r') as countfile:
 
 
 for line in sys.stdin:
-    term = line.split("\t")[0]
-    term_freq_per_doc_obj = line.split("\t")[1]
-    term_freq_per_doc_dict = json.loads(term_freq_per_doc_obj)
-    n_k = len(term_freq_per_doc_dict)
+    term, *term_freq_per_doc = line.rstrip("\n").split("\t")
+    doc_ids = term_freq_per_doc[0::2]
+    tf_iks = term_freq_per_doc[1::2]
+    n_k = len(doc_ids)
     idf_k = math.log(DOC_COUNT / n_k, 10)
-    for doc_id, tf_ik in term_freq_per_doc_dict.items():
-        w_ik = tf_ik * idf_k
-        info_per_doc = {
-            "term": term,
-            "w_ik": w_ik,
-            "tf_ik": tf_ik,
-            "idf_k": idf_k
-        }
-        info_per_doc_obj = json.dumps(info_per_doc)
-        print(f"{doc_id}\t{info_per_doc_obj}")
+    for doc_id, tf_ik in zip(doc_ids, tf_iks):
+        print(f"{doc_id}\t{term}\t{tf_ik}\t{idf_k}")
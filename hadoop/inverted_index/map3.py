@@ -2,24 +2,20 @@
 """
 
 Map 3.
-reduced_id1  {"term_list": [{"term": term1, "idf_k": num, "tf_ik": int, "norm": num, "doc_id": int}, {"term": term3, }, ...]}.
-reduced_id2  {"term_list": [{"term": term3, "idf_k": num, "tf_ik": int, "norm": num, "doc_id": int}, {"term": term6, }, ...]}.
-Totally 3 reduced_id's.
+reduced_id  term_1  doc_id  tf_ik  norm  idf_k
+reduced_id  term_2  doc_id  tf_ik  norm  idf_k
+One line per posting.  Totally 3 reduced_id's.
+Sorting whole lines sorts each segment by (term, doc_id), so reduce3 can
+stream its input.
 """
 import sys
-import json
 
 
 NUM_REDUCE_TASKS = 3
 
 for line in sys.stdin:
-    doc_id = line.split("\t")[0]
-    info_per_doc = line.split("\t")[1]
-    info_per_doc_dict = json.loads(info_per_doc)
+    doc_id, norm, *term_list = line.rstrip("\n").split("\t")
     reduced_id = int(doc_id) % NUM_REDUCE_TASKS
-    for i in range(len(info_per_doc_dict["term_list"])):
-        info_per_doc_dict["term_list"][i]["norm"] = info_per_doc_dict["norm"]
-        info_per_doc_dict["term_list"][i]["doc_id"] = doc_id
-    info_per_doc_dict.pop("norm", None)
-    info_per_doc_obj = json.dumps(info_per_doc_dict)
-    print(f"{reduced_id}\t{info_per_doc_obj}")
+    for i in range(0, len(term_list), 3):
+        term, tf_ik, idf_k = term_list[i:i + 3]
+        print(f"{reduced_id}\t{term}\t{doc_id}\t{tf_ik}\t{norm}\t{idf_k}")
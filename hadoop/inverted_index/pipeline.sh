@@ -54,9 +54,13 @@ hadoop \
   -mapper ./map2.py \
   -reducer ./reduce2.py
 
-# Job 3
+# Job 3.  Partition by segment on the first field, but sort on the first
+# three (segment, term, doc_id) so reduce3 can stream its input.
 hadoop \
   jar ../hadoop-streaming-2.7.2.jar \
+  -D stream.num.map.output.key.fields=3 \
+  -D mapreduce.partition.keypartitioner.options=-k1,1 \
+  -partitioner org.apache.hadoop.mapred.lib.KeyFieldBasedPartitioner \
   -input output2 \
   -output output \
   -mapper ./map3.py \
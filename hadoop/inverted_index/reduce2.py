@@ -2,44 +2,26 @@
 """
 
 Reduce 2.
-doc_id1  {"norm": num, "term_list": [{"term": term1, "idf_k": num, "tf_ik": int}, {"term": term2, ...}, ...]}.
-doc_id2  {"norm": num, "term_list": [{"term": term2, "idf_k": num, "tf_ik": int}, {"term": term4, ...}, ...]}.
-Note that doc_id is unique.
+doc_id1  norm  term1  tf_ik  idf_k  term2  tf_ik  idf_k  ...
+doc_id2  norm  term2  tf_ik  idf_k  term4  tf_ik  idf_k  ...
+Note that doc_id is unique.  Fields are separated by tabs.
 """
 import sys
-import json
 import itertools
 
 
-TOTAL_NORM_PER_DOC = {}
-TERMS_PER_DOC = {}
-
 def reduce_one_group(key, group):
-    terms_list = []
-    for line in group:
-        info_per_doc_obj = line.partition("\t")[2]
-        info_per_doc_dict = json.loads(info_per_doc_obj)
-        w_ik = info_per_doc_dict["w_ik"]
-        if key in TOTAL_NORM_PER_DOC:
-            TOTAL_NORM_PER_DOC[key] += pow(w_ik, 2)
-        else:
-            TOTAL_NORM_PER_DOC[key] = pow(w_ik, 2)
-        terms_list.append(info_per_doc_dict)
-    TERMS_PER_DOC[key] = terms_list
-
-
-def integrate_group(key, group):
+    # Output each document as soon as its group ends, so only the current
+    # document is held in memory
+    norm = 0.0
     term_list = []
     for line in group:
-        info_per_doc_dict = line
-        info_per_doc_dict.pop("w_ik", None)
-        term_list.append(info_per_doc_dict)
-    output_per_doc = {
-        "norm": TOTAL_NORM_PER_DOC[key],
-        "term_list": term_list
-    }
-    output_per_doc_obj = json.dumps(output_per_doc)
-    print(f"{key}\t{output_per_doc_obj}")
+        _, term, tf_ik, idf_k = line.rstrip("\n").split("\t")
+        w_ik = int(tf_ik) * float(idf_k)
+        norm += pow(w_ik, 2)
+        term_list.append(f"{term}\t{tf_ik}\t{idf_k}")
+    term_list_str = "\t".join(term_list)
+    print(f"{key}\t{norm}\t{term_list_str}")
 
 
 def keyfunc(line):
@@ -49,8 +31,6 @@ def keyfunc(line):
 def main():
     for key, group in itertools.groupby(sys.stdin, keyfunc):
         reduce_one_group(key, group)
-    for key, group in TERMS_PER_DOC.items():
-        integrate_group(key, group)
 
 
 if __name__ == "__main__":
@@ -2,64 +2,77 @@
 """
 
 Reduce 3.
-reduced_id1  {term1: {"idf_k": num, "term_info_appear": [{"doc_id": str, "tf_ik": int, "norm": num}, {}]}, term2: {  }, ...}.
-reduced_id2  {term1: {"idf_k": num, "term_info_appear": [{"doc_id": str, "tf_ik": int, "norm": num}, {}]}, term4: {  }, ...}.
+term1 idf_k doc_id tf_ik norm doc_id tf_ik norm ...
+term2 idf_k doc_id tf_ik norm ...
+Input lines are sorted by (reduced_id, term, doc_id), so each term's line is
+written as soon as its group ends and memory does not grow with the segment.
+Set REDUCE3_EXTERNAL_SORT=1 when the input is not sorted that way: it is then
+sorted in runs of REDUCE3_RUN_LINES lines spilled to temporary files, which
+are merged.
 """
 import sys
-import json
+import os
+import heapq
 import itertools
+import tempfile
+import contextlib
 
 
-def output_one_group(current_file_terms_sorted, output_file):
-    for (term, term_info) in current_file_terms_sorted:
-        idf_k = term_info["idf_k"]
-        appear_str_list = []
-        term_info_appear_list = term_info["term_info_appear"]
-        term_info_appear_list_sorted = sorted(
-            term_info_appear_list, key=lambda dict: dict["doc_id"]
-        )
-        for new_term_dict in term_info_appear_list_sorted:
-            current_str = ' '.join(new_term_dict.values())
-            appear_str_list.append(current_str)
-        all_appear_str = ' '.join(appear_str_list)
-        print(f"{term} {idf_k} {all_appear_str}")
+EXTERNAL_SORT = os.environ.get("REDUCE3_EXTERNAL_SORT", "0") != "0"
+RUN_LINES = int(os.environ.get("REDUCE3_RUN_LINES", "1000000"))
 
 
-def reduce_one_group(key, group):
-    output_file = f"part-0000{key}"
-    current_file_terms = {}
-    for line in group:
-        info_per_doc = line.partition("\t")[2]
-        info_per_doc_dict = json.loads(info_per_doc)
-        for term_dict in info_per_doc_dict["term_list"]:
-            term_name = term_dict["term"]
-            new_term_dict = {
-                "doc_id": str(term_dict["doc_id"]),
-                "tf_ik": str(term_dict["tf_ik"]),
-                "norm": str(term_dict["norm"])
-            }
-            if term_name not in current_file_terms:
-                current_file_terms[term_name] = {
-                    "idf_k": str(term_dict["idf_k"]),
-                    "term_info_appear": [new_term_dict]
-                }
-            else:
-                current_file_terms[term_name]["term_info_appear"].append(
-                    new_term_dict
-                )
-    current_file_terms_sorted = sorted(
-        current_file_terms.items(), key=lambda kv: kv[0]
-    )
-    output_one_group(current_file_terms_sorted, output_file)
+def external_sort(lines, tmpdir, stack):
+    # Sort runs of lines in memory, spill them and merge the sorted files
+    run_files = []
+    while True:
+        run = sorted(itertools.islice(lines, RUN_LINES))
+        if not run:
+            break
+        run_file = stack.enter_context(tempfile.TemporaryFile(
+            "w+", encoding="utf-8", dir=tmpdir
+        ))
+        run_file.writelines(run)
+        run_file.seek(0)
+        run_files.append(run_file)
+    return heapq.merge(*run_files)
+
+
+def check_sorted(lines):
+    prev_line = ""
+    for line in lines:
+        if line < prev_line:
+            sys.exit(
+                "reduce3: input is not sorted by (term, doc_id), "
+                "set REDUCE3_EXTERNAL_SORT=1"
+            )
+        prev_line = line
+        yield line
+
+
+def output_one_group(term, group):
+    for i, line in enumerate(group):
+        _, _, doc_id, tf_ik, norm, idf_k = line.rstrip("\n").split("\t")
+        if i == 0:
+            sys.stdout.write(f"{term} {idf_k}")
+        sys.stdout.write(f" {doc_id} {tf_ik} {norm}")
+    sys.stdout.write("\n")
 
 
 def keyfunc(line):
-    return line.partition("\t")[0]
+    return line.split("\t", 2)[:2]
 
 
 def main():
-    for key, group in itertools.groupby(sys.stdin, keyfunc):
-        reduce_one_group(key, group)
+    with contextlib.ExitStack() as stack:
+        lines = sys.stdin
+        if EXTERNAL_SORT:
+            tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+            lines = external_sort(lines, tmpdir, stack)
+        else:
+            lines = check_sorted(lines)
+        for (_, term), group in itertools.groupby(lines, keyfunc):
+            output_one_group(term, group)
 
 
 if __name__ == "__main__":
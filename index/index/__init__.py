@@ -8,5 +8,33 @@ app = flask.Flask(__name__)
 app.config["INDEX_PATH"] = os.getenv("INDEX_PATH")
 app.config["EMPTY_HITS"] = {"hits": []}
 
+# Memory cap of the query result cache, in bytes
+app.config["RESULT_CACHE_BYTES"] = int(
+    os.getenv("INDEX_RESULT_CACHE_BYTES", str(64 * 1024 * 1024))
+)
+
+# Optional file of hits queries run after loading, one query string per line
+app.config["INDEX_WARMUP_PATH"] = os.getenv("INDEX_WARMUP_PATH")
+
+# Optional directory whose subdirectories are index versions, each laid out
+# like this package with stopwords.txt, pagerank.out and inverted_index/
+app.config["INDEX_VERSIONS_DIR"] = os.getenv("INDEX_VERSIONS_DIR")
+
+# Seconds between checks of INDEX_VERSIONS_DIR for a new version, or 0
+app.config["INDEX_WATCH_SECONDS"] = float(
+    os.getenv("INDEX_WATCH_SECONDS", "0")
+)
+
+app.config["SEGMENT_EXECUTOR"] = None
+
+# Thread loading the index in the background
+app.config["INDEX_LOADER"] = None
+
 # Tell our app about api and inverted_index.
 import index.api  # noqa: E402  pylint: disable=wrong-import-position
+
+# Start loading the index as soon as the app exists, so that the first query
+# finds it loaded.  Without INDEX_PATH, for example when running
+# index.segment, nothing is loaded.
+if app.config["INDEX_PATH"]:
+    index.api.start_loading()
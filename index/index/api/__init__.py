@@ -1,4 +1,8 @@
 """Index APIs."""
 from index.api.main import startup
+from index.api.main import start_loading
 from index.api.main import get_index
 from index.api.main import get_hits
+from index.api.main import get_ready
+from index.api.main import post_reload
+from index.api.main import get_stats
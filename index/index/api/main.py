@@ -1,67 +1,430 @@
 """Index Server main code."""
+import collections
+import concurrent.futures
+import heapq
+import itertools
 import math
 import pathlib
 import re
-from flask import (jsonify, request)
+import threading
+import time
+import flask
+from flask import (abort, jsonify, request)
+import numpy as np
 import index
+import index.cache
+import index.engine
+import index.segment
+import index.state
 
 
-STOPWORDS_SET = set()
-PAGERANK_DICT = {}
-INVERTEDINDEX_DICT = {}
+# Directory holding stopwords.txt, pagerank.out and inverted_index/
+PACKAGE_DIR = pathlib.Path(__file__).parent.parent
 
 
-@index.app.before_first_request
-def startup():
-    """Load inverted index, pagerank, and stopwords into memory."""
-    index_dir = pathlib.Path(__file__).parent.parent
-    read_stopwords(index_dir)
-    read_pagerank(index_dir)
-    read_inverted_index(index_dir)
+# Pagerank of every document, as a sorted array of doc ids and an array of
+# scores aligned with it
+Pagerank = collections.namedtuple("Pagerank", ["doc_ids", "scores"])
+
+# A mapped segment, the version its cached results belong to, the pagerank
+# loaded with it and the largest pagerank in each block of its posting lists,
+# filled in lazily per term
+SegmentIndex = collections.namedtuple(
+    "SegmentIndex",
+    ["name", "segment", "version", "pagerank", "pagerank_bounds"]
+)
+
+# WSGI environ key holding the positions of the segments a request searches.
+# Requests without it search every segment.
+SEGMENTS_ENVIRON_KEY = "index.segments"
+
+# WSGI environ key holding the IndexState a request searches instead of the
+# one being served, used to warm up a new version
+STATE_ENVIRON_KEY = "index.state"
+
+# Held while an index version is loaded, so that loads do not overlap
+RELOAD_LOCK = threading.Lock()
+
+# Held while the background load at startup is started, so that it starts
+# once
+LOADER_LOCK = threading.Lock()
+
+# Errors that make loading an index version fail
+LOAD_ERRORS = (OSError, ValueError, index.segment.SegmentError)
+
+# Relative slack on score upper bounds, which are computed in a different
+# order than the scores themselves and may round differently
+BOUND_TOLERANCE = 1e-9
+
+
+class LogErrors:
+    """Context manager that logs and suppresses any Exception in its block.
+
+    Background threads use it so that an unexpected error is logged and does
+    not end the thread.
+    """
+
+    def __init__(self, message):
+        """Log errors with message."""
+        self.message = message
+
+    def __enter__(self):
+        """Run the block."""
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        """Log exc and suppress it if it is an Exception."""
+        if not isinstance(exc, Exception):
+            return False
+        index.app.logger.error(
+            self.message, exc_info=(exc_type, exc, traceback)
+        )
+        return True
+
+
+def startup(index_dir=None):
+    """Load inverted index, pagerank, and stopwords, then serve them.
+
+    index_dir defaults to the package directory.  RELOAD_LOCK is held for
+    the whole load.
+    """
+    with RELOAD_LOCK:
+        load_and_serve(index_dir)
+
+
+def load_and_serve(index_dir=None):
+    """Load the index in index_dir and serve it.
+
+    The caller must hold RELOAD_LOCK.  The load is tracked in INDEX_STATUS
+    for the readiness endpoint.  If a warm-up file is configured, its
+    queries are run on the new index before it is served.  An index that is
+    already being served keeps serving until then.
+    """
+    index_dir = PACKAGE_DIR if index_dir is None else pathlib.Path(index_dir)
+    # Status dicts are replaced, never changed, as requests may read them
+    status = index.app.config.get("INDEX_STATUS", {"state": "unloaded"})
+    if status["state"] == "ready":
+        index.app.config["INDEX_STATUS"] = {
+            **status, "reloading": str(index_dir)
+        }
+    else:
+        index.app.config["INDEX_STATUS"] = {
+            "state": "loading", "index_dir": str(index_dir)
+        }
+    start_time = time.monotonic()
+    try:
+        index_state = load_index(index_dir)
+        warmup_queries = 0
+        if index.app.config["INDEX_WARMUP_PATH"]:
+            warmup_queries = warm_up(
+                index_state, index.app.config["INDEX_WARMUP_PATH"]
+            )
+    except Exception as err:
+        if status["state"] == "ready":
+            index.app.config["INDEX_STATUS"] = {
+                **status, "reload_error": f"{index_dir}: {err}"
+            }
+        else:
+            index.app.config["INDEX_STATUS"] = {
+                "state": "failed", "index_dir": str(index_dir)
+            }
+        raise
+    swap_index(index_state)
+    index.app.config["INDEX_STATUS"] = {
+        "state": "ready",
+        "index_dir": str(index_dir),
+        "load_seconds": time.monotonic() - start_time,
+        "num_terms": sum(
+            len(segment_index.segment)
+            for segment_index in index_state.segments
+        ),
+        "num_postings": sum(
+            segment_index.segment.num_postings
+            for segment_index in index_state.segments
+        ),
+        "segments": [
+            segment_index.name for segment_index in index_state.segments
+        ],
+        "version": index_state.version,
+        "warmup_queries": warmup_queries,
+    }
+
+
+def start_loading():
+    """Start loading the index in a background thread, once.
+
+    Nothing is started if an index was loaded another way.  Return the
+    loader thread, or None.
+    """
+    with LOADER_LOCK:
+        if (index.app.config["INDEX_LOADER"] is None
+                and "INDEX_STATUS" not in index.app.config):
+            index.app.config["INDEX_LOADER"] = threading.Thread(
+                target=load_at_startup, name="index-load", daemon=True
+            )
+            index.app.config["INDEX_LOADER"].start()
+        return index.app.config["INDEX_LOADER"]
+
+
+def load_at_startup():
+    """Load the newest version or the package directory, then watch.
+
+    A failed load is logged and reported by the readiness endpoint.  With
+    INDEX_WATCH_SECONDS set, new versions are loaded as they appear.
+    """
+    with LogErrors("Failed to load the index"):
+        startup(latest_version() if versions_dir() is not None else None)
+    if versions_dir() is not None and index.app.config["INDEX_WATCH_SECONDS"]:
+        watch_versions(index.app.config["INDEX_WATCH_SECONDS"])
+
+
+def load_index(index_dir):
+    """Return an IndexState with everything loaded from index_dir."""
+    pagerank = read_pagerank(index_dir)
+    return index.state.IndexState(
+        index_dir=index_dir,
+        stopwords=read_stopwords(index_dir),
+        pagerank=pagerank,
+        segments=read_inverted_index(index_dir, pagerank),
+        result_cache=index.cache.ResultCache(
+            index.app.config["RESULT_CACHE_BYTES"]
+        ),
+    )
+
+
+def swap_index(index_state):
+    """Serve index_state from now on and retire the state it replaces.
+
+    Requests that hold the old state finish on it, and its segments are
+    unmapped after the last of them.
+    """
+    # Every version has the segments named by INDEX_PATH, so one pool of
+    # threads serves all of them
+    num_segments = len(index_state.segments)
+    if num_segments > 1 and index.app.config["SEGMENT_EXECUTOR"] is None:
+        index.app.config["SEGMENT_EXECUTOR"] = \
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=num_segments, thread_name_prefix="segment"
+            )
+    old_state = index.app.config.get("INDEX")
+    index.app.config["INDEX"] = index_state
+    if old_state is not None:
+        old_state.retire()
+
+
+def acquire_index():
+    """Return the IndexState being served, registered as in use.
+
+    Wait for the load at startup if no index is served yet, and respond 503
+    if there is still none.
+    """
+    loader = index.app.config["INDEX_LOADER"]
+    if loader is not None and "INDEX" not in index.app.config:
+        loader.join()
+    while True:
+        index_state = index.app.config.get("INDEX")
+        if index_state is None:
+            abort(503)
+        if index_state.acquire():
+            return index_state
+
+
+def warm_up(index_state, warmup_file):
+    """Send the hits requests listed in warmup_file, return how many.
+
+    Each line is the query string of a hits request, for example
+    "q=michigan+wolverine&w=0.3".  The requests are run on index_state
+    before it is served, which faults in the pages of the segments they
+    touch and fills its result cache.  With several segments, every request
+    is sent to each segment alone and to all of them.
+    """
+    num_segments = len(index_state.segments)
+    selections = [(position,) for position in range(num_segments)]
+    if num_segments > 1:
+        selections.append(tuple(range(num_segments)))
+    num_queries = 0
+    with open(str(warmup_file), 'r', encoding='utf-8') as queryfile, \
+            index.app.test_client() as client:
+        for line in queryfile:
+            query_string = line.strip()
+            if not query_string:
+                continue
+            for positions in selections:
+                client.get(
+                    "/api/v1/hits/", query_string=query_string,
+                    environ_overrides={
+                        SEGMENTS_ENVIRON_KEY: positions,
+                        STATE_ENVIRON_KEY: index_state,
+                    },
+                )
+            num_queries += 1
+    return num_queries
 
 
 def read_stopwords(index_dir):
     """Read the stopwords.txt file."""
     stopwords_file = index_dir / "stopwords.txt"
+    stopwords_set = set()
     with open(str(stopwords_file), 'r', encoding='utf-8') as stopfile:
         for line in stopfile:
-            STOPWORDS_SET.add(line.strip())
+            stopwords_set.add(line.strip())
+    return frozenset(stopwords_set)
 
 
 def read_pagerank(index_dir):
-    """Read the pagerank.out file."""
+    """Read the pagerank.out file into sorted arrays."""
     pagerank_file = index_dir / "pagerank.out"
+    pagerank_dict = {}
     with open(str(pagerank_file), 'r', encoding='utf-8') as pagerankfile:
         for line in pagerankfile:
             line = line.strip()
             doc_id, score = line.split(",")
-            PAGERANK_DICT[doc_id] = float(score)
-
-
-def read_inverted_index(index_dir):
-    """Read the inverted_index.txt file, based on the configured envvar."""
-    index_file_config = index.app.config["INDEX_PATH"]
-    inverted_index_file = index_dir / "inverted_index" / index_file_config
-    with open(str(inverted_index_file), 'r', encoding='utf-8') as indexfile:
-        for line in indexfile:
-            term_info_list = line.strip().split()
-            term_name = term_info_list[0]
-            idf_k = term_info_list[1]
-            counter = 2
-            term_appears = []
-            while counter < len(term_info_list):
-                curr_appear = {
-                    "doc_id": term_info_list[counter],
-                    "tf_ik": int(term_info_list[counter + 1]),
-                    "norm": float(term_info_list[counter + 2])
-                }
-                term_appears.append(curr_appear)
-                counter += 3
-            term_context = {
-                "idf_k": idf_k,
-                "term_info_appear": term_appears
-            }
-            INVERTEDINDEX_DICT[term_name] = term_context
+            pagerank_dict[int(doc_id)] = float(score)
+    doc_ids = sorted(pagerank_dict)
+    return Pagerank(
+        doc_ids=np.array(doc_ids, dtype=np.int64),
+        scores=np.array([pagerank_dict[doc_id] for doc_id in doc_ids],
+                        dtype=np.float64),
+    )
+
+
+def read_inverted_index(index_dir, pagerank):
+    """Map the inverted index segments named by the configured envvar.
+
+    INDEX_PATH names one segment or several separated by commas.  A text
+    segment is converted to the binary segment format once, after which
+    startup only maps the binary file into memory.
+    """
+    segments = []
+    for index_file_config in index.app.config["INDEX_PATH"].split(","):
+        inverted_index_file = index_dir / "inverted_index" / index_file_config
+        segment = index.segment.load_segment(inverted_index_file)
+        # Cached results are tied to the file they were computed from
+        segment_stat = segment.path.stat()
+        segments.append(SegmentIndex(
+            name=index_file_config,
+            segment=segment,
+            version=f"{segment.path.name}-{segment_stat.st_mtime_ns:x}",
+            pagerank=pagerank,
+            pagerank_bounds={},
+        ))
+    return segments
+
+
+def versions_dir():
+    """Return the configured directory of index versions, or None."""
+    if not index.app.config["INDEX_VERSIONS_DIR"]:
+        return None
+    return pathlib.Path(index.app.config["INDEX_VERSIONS_DIR"])
+
+
+def latest_version():
+    """Return the newest index version directory, or None.
+
+    Versions are subdirectories of INDEX_VERSIONS_DIR and sort by name, for
+    example by timestamp.  Publish a version by renaming a complete
+    directory into place.
+    """
+    versions = sorted(
+        path for path in versions_dir().iterdir()
+        if path.is_dir() and not path.name.startswith(".")
+    )
+    return versions[-1] if versions else None
+
+
+def try_reload_lock():
+    """Take RELOAD_LOCK unless a load holds it, return whether it was taken.
+
+    The lock is not released on return.  Its owner releases it when its load
+    ends, possibly from another thread.
+    """
+    return RELOAD_LOCK.acquire(blocking=False)
+
+
+def reload_in_background(index_dir):
+    """Load index_dir in a background thread and serve it once ready.
+
+    The caller must hold RELOAD_LOCK, which the thread releases when the
+    load ends.
+    """
+    def reload_index():
+        try:
+            load_and_serve(index_dir)
+        except LOAD_ERRORS:
+            # Keep serving the old index
+            index.app.logger.exception("Failed to load %s", index_dir)
+        finally:
+            RELOAD_LOCK.release()
+    thread = threading.Thread(
+        target=reload_index, name="index-reload", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def watch_versions(interval, stop=None):
+    """Poll INDEX_VERSIONS_DIR and load each new version that appears.
+
+    Polling ends once the optional threading.Event stop is set.  A version
+    that fails to load is not tried again until its directory changes.
+    Return the polling thread.
+    """
+    stop = threading.Event() if stop is None else stop
+
+    def watch():
+        # The version that failed to load and its modification time
+        failed = None
+        while not stop.wait(interval):
+            # Whatever goes wrong, try again at the next poll
+            with LogErrors("Failed to load a new version"):
+                index_dir = latest_version()
+                current = index.app.config["INDEX_STATUS"]["index_dir"]
+                if index_dir is None or str(index_dir) == current:
+                    continue
+                attempt = (index_dir, index_dir.stat().st_mtime_ns)
+                if attempt == failed:
+                    continue
+                failed = attempt
+                startup(index_dir)
+                failed = None
+    thread = threading.Thread(
+        target=watch, name="index-watch", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+@index.app.before_request
+def before_request():
+    """Hold the index being served for the whole request.
+
+    The first request starts loading the index if the package did not start
+    it when it was imported.  The readiness endpoint does not use the index,
+    so it answers while no index is served.
+    """
+    start_loading()
+    if request.endpoint == "get_ready":
+        return
+    index_state = request.environ.get(STATE_ENVIRON_KEY)
+    if index_state is None or not index_state.acquire():
+        index_state = acquire_index()
+    flask.g.index_state = index_state
+
+
+@index.app.after_request
+def after_request(response):
+    """Tell the client which index version answered."""
+    if "index_state" in flask.g:
+        response.headers["X-Index-Version"] = flask.g.index_state.version
+    return response
+
+
+@index.app.teardown_request
+def teardown_request(_error):
+    """Release the index held by the request."""
+    index_state = flask.g.pop("index_state", None)
+    if index_state is not None:
+        index_state.release()
 
 
 @index.app.route('/api/v1/', methods=["GET"])
@@ -69,6 +432,9 @@ def get_index():
     """Return basic information."""
     context = {
         "hits": "/api/v1/hits/",
+        "ready": "/api/v1/ready/",
+        "reload": "/api/v1/reload/",
+        "stats": "/api/v1/stats/",
         "url": "/api/v1/"
     }
     return jsonify(**context)
@@ -76,106 +442,299 @@ def get_index():
 
 @index.app.route('/api/v1/hits/', methods=["GET"])
 def get_hits():
-    """Return hits based on the query."""
+    """Return hits based on the query.
+
+    Optional 'k' and 'offset' arguments return only hits offset to offset + k
+    of the ranking.  Without 'k' every matching document is returned.
+    """
     # queries = request.query_string.decode('utf-8')
     query = request.args.get("q", default='', type=str)
     weight = request.args.get("w", default=0.5, type=float)
-    query_list = process_query(query)
+    k = request.args.get("k", default=None, type=int)
+    offset = request.args.get("offset", default=0, type=int)
+    if (k is not None and k < 0) or offset < 0:
+        abort(400)
+    index_state = flask.g.index_state
+    query_list = process_query(query, index_state.stopwords)
     print(query_list)
     if len(query_list) == 0:
         return index.app.config["EMPTY_HITS"]
-    documents_contain = get_documents(query_list)
-    if len(documents_contain) == 0:
-        return index.app.config["EMPTY_HITS"]
-    documents_ranked = rank_documents(query_list, documents_contain, weight)
+    limit = None if k is None else offset + k
+    positions = request.environ.get(
+        SEGMENTS_ENVIRON_KEY, range(len(index_state.segments))
+    )
+    documents_ranked = search_index(
+        index_state, [index_state.segments[i] for i in positions],
+        query_list, weight, limit
+    )
     documents_ranked_context = []
-    for document_info in documents_ranked:
+    for document_info in documents_ranked[offset:]:
         documents_ranked_context.append({
-            "docid": int(document_info[0]),
+            "docid": document_info[0],
             "score": document_info[1]
         })
     hit_context = {"hits": documents_ranked_context}
     return jsonify(**hit_context)
 
 
-def process_query(query):
+@index.app.route('/api/v1/ready/', methods=["GET"], strict_slashes=False)
+def get_ready():
+    """Return the load state of the index, with status 503 until ready."""
+    status = index.app.config.get("INDEX_STATUS", {"state": "unloaded"})
+    return jsonify(**status), 200 if status["state"] == "ready" else 503
+
+
+@index.app.route('/api/v1/reload/', methods=["POST"])
+def post_reload():
+    """Start loading a new index version in the background.
+
+    With INDEX_VERSIONS_DIR configured, the optional 'version' argument names
+    the version directory to load, by default the newest.  Otherwise the
+    package directory is loaded again.  The current version is served until
+    the new one is ready.  Respond 409 if another load is running.
+    """
+    if versions_dir() is None:
+        index_dir = PACKAGE_DIR
+    else:
+        version = request.args.get("version")
+        if version is None:
+            index_dir = latest_version()
+        elif version.startswith(".") or pathlib.Path(version).name != version:
+            abort(400)
+        else:
+            index_dir = versions_dir() / version
+        if index_dir is None or not index_dir.is_dir():
+            abort(404)
+    # The reload thread releases the lock when it is done
+    if not try_reload_lock():
+        abort(409)
+    reload_in_background(index_dir)
+    context = {"index_dir": str(index_dir)}
+    return jsonify(**context), 202
+
+
+@index.app.route('/api/v1/stats/', methods=["GET"])
+def get_stats():
+    """Return result cache counters and the requests using the index."""
+    index_state = flask.g.index_state
+    context = {
+        "in_flight": index_state.in_flight(),
+        "result_cache": index_state.result_cache.stats(),
+        "version": index_state.version,
+    }
+    return jsonify(**context)
+
+
+def search_index(index_state, segments, query_list, weight, limit):
+    """Return the best limit documents for a query, or all if limit is None.
+
+    Several segments are searched in parallel and their rankings merged.
+    Rankings are looked up in the result cache first and stored in it after
+    they are computed.
+    """
+    result_cache = index_state.result_cache
+    version = index_state.version
+    key = (tuple(segment_index.name for segment_index in segments),
+           tuple(query_list), weight, limit)
+    documents_ranked = result_cache.get(version, key)
+    if documents_ranked is None:
+        if len(segments) == 1:
+            documents_ranked = search_segment(
+                segments[0], query_list, weight, limit
+            )
+        else:
+            rankings = index.app.config["SEGMENT_EXECUTOR"].map(
+                search_segment, segments, itertools.repeat(query_list),
+                itertools.repeat(weight), itertools.repeat(limit)
+            )
+            documents_ranked = list(itertools.islice(
+                heapq.merge(*rankings, key=rank_key), limit
+            ))
+        result_cache.put(version, key, documents_ranked)
+    return documents_ranked
+
+
+def search_segment(segment_index, query_list, weight, limit):
+    """Return the best limit documents of one segment."""
+    term_postings = get_postings(segment_index.segment, query_list)
+    if term_postings is None:
+        return []
+    return rank_documents(
+        segment_index, query_list, term_postings, weight, limit
+    )
+
+
+def process_query(query, stopwords_set):
     """Process and clean the query."""
     query = re.sub(r"[^a-zA-Z0-9 ]+", "", query)
     query = query.strip().casefold()
     query_list = query.split()
     query_list_nostop = []
     for curr_query in query_list:
-        if curr_query not in STOPWORDS_SET:
+        if curr_query not in stopwords_set:
             query_list_nostop.append(curr_query)
     return query_list_nostop
 
 
-def get_documents(query_list):
-    """Get documents that contain all query terms."""
-    documents_contain = {}
-    for query in query_list:
-        if query not in INVERTEDINDEX_DICT:
-            return documents_contain
-    document_set_list = []
+def get_postings(inverted_index, query_list):
+    """Get the postings of each distinct query term in a segment.
+
+    Return None if some term is not in the segment, because then no document
+    contains all query terms.
+    """
+    term_postings = {}
     for query in query_list:
-        term_dict = INVERTEDINDEX_DICT[query]
-        document_set = set()
-        for doc_appear in term_dict["term_info_appear"]:
-            document_set.add(doc_appear["doc_id"])
-        document_set_list.append(document_set)
-    document_set_all = set.intersection(*document_set_list)
-    for doc_id in document_set_all:
-        document_dict = {}
-        for query in query_list:
-            term_dict = INVERTEDINDEX_DICT[query]
-            term_dict_context = None
-            for term_appear_dict in term_dict["term_info_appear"]:
-                if term_appear_dict["doc_id"] == doc_id:
-                    term_dict_context = {
-                        # "idf_k": term_dict["idf_k"],
-                        "tf_ik": term_appear_dict["tf_ik"],
-                        "norm": term_appear_dict["norm"]
-                    }
-            document_dict[query] = term_dict_context
-        documents_contain[doc_id] = document_dict
-    return documents_contain
-
-
-def rank_documents(query_list, documents_contain, weight):
-    """Rank the gotten documents based on pagerank and tf-idf score."""
-    overall_score_list = []
-    for doc_id, document_dict in documents_contain.items():
-        pagerank_score = calculate_pagerank_score(doc_id)
-        tfidf_score = calculate_tfidf_score(query_list, document_dict)
-        weightd_score = weight * pagerank_score + (1 - weight) * tfidf_score
-        overall_score_list.append((doc_id, weightd_score))
-    ranked_score_list = sorted(
-        overall_score_list, key=lambda x: (-x[1], int(x[0]))
+        postings = inverted_index.get(query)
+        if postings is None:
+            return None
+        term_postings[query] = postings
+    return term_postings
+
+
+def rank_documents(segment_index, query_list, term_postings, weight,
+                   limit=None):
+    """Rank the documents of a segment that contain all query terms.
+
+    Documents are ranked on pagerank and tf-idf score.  If limit is given,
+    only the best limit documents are returned.
+    """
+    if limit is not None and 0 <= weight <= 1:
+        return rank_top_documents(
+            segment_index, query_list, term_postings, weight, limit
+        )
+    documents_contain = index.engine.intersect(term_postings)
+    doc_ids, scores = score_documents(
+        segment_index.pagerank, query_list, documents_contain, weight
+    )
+    ranking = np.lexsort((doc_ids, -scores))[:limit]
+    return list(zip(doc_ids[ranking].tolist(), scores[ranking].tolist()))
+
+
+def rank_top_documents(segment_index, query_list, term_postings, weight,
+                       limit):
+    """Return the best limit documents, skipping blocks that cannot make it.
+
+    Blocks of the rarest posting list are scored in doc id order while the
+    best limit documents so far are kept in a heap.  Once the heap is full, a
+    block is only intersected if an upper bound on the scores in it reaches
+    the lowest score in the heap.  The bound combines the largest pagerank in
+    the block with the largest weight each term has in the block's doc id
+    range.  The result is the same as ranking every document.
+    """
+    if limit == 0:
+        return []
+    query_weights = {
+        term: query_list.count(term) * postings.idf_k
+        for term, postings in term_postings.items()
+    }
+    norm_q = math.sqrt(sum(pow(q, 2) for q in query_weights.values()))
+    heap = []
+
+    def keep_block(lead_term, block, first_doc_id, last_doc_id):
+        """Return True if a document in the block could enter the heap."""
+        if len(heap) < limit:
+            return True
+        tfidf_bound = 0.0
+        for term, postings in term_postings.items():
+            max_weight = index.engine.max_weight_between(
+                postings, first_doc_id, last_doc_id
+            )
+            if max_weight is None:
+                return False
+            if query_weights[term]:
+                tfidf_bound += query_weights[term] * max_weight / norm_q
+        pagerank_bound = calculate_pagerank_bound(
+            segment_index, lead_term, term_postings[lead_term], block
+        )
+        bound = weight * pagerank_bound + (1 - weight) * tfidf_bound
+        return bound * (1 + BOUND_TOLERANCE) >= heap[0][0]
+
+    for documents_contain in index.engine.intersect_blocks(
+            term_postings, keep_block):
+        doc_ids, scores = score_documents(
+            segment_index.pagerank, query_list, documents_contain, weight
+        )
+        for doc_id, score in zip(doc_ids.tolist(), scores.tolist()):
+            entry = (score, -doc_id)
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+    return sorted(
+        ((-neg_doc_id, score) for score, neg_doc_id in heap), key=rank_key
     )
-    return ranked_score_list
 
 
-def calculate_pagerank_score(doc_id):
-    """Calculate pagerank score."""
-    pagerank_score = PAGERANK_DICT[doc_id]
-    return pagerank_score
+def score_documents(pagerank, query_list, documents_contain, weight):
+    """Score every candidate document at once.
+
+    Return (doc_ids, scores) as NumPy arrays aligned with the candidates.
+    """
+    doc_ids = np.frombuffer(documents_contain.doc_ids, dtype=np.uint32)
+    pagerank_scores = calculate_pagerank_scores(pagerank, doc_ids)
+    tfidf_scores = calculate_tfidf_scores(query_list, documents_contain)
+    weightd_scores = weight * pagerank_scores + (1 - weight) * tfidf_scores
+    return doc_ids, weightd_scores
+
+
+def rank_key(document_info):
+    """Order (doc_id, score) pairs by descending score, then by doc_id."""
+    return (-document_info[1], document_info[0])
 
 
-def calculate_tfidf_score(query_list, document_dict):
-    """Calculate tf-idf score."""
+def calculate_pagerank_scores(pagerank, doc_ids):
+    """Return the pagerank of each document in the doc_ids array."""
+    positions = np.searchsorted(pagerank.doc_ids, doc_ids)
+    positions[positions == len(pagerank.doc_ids)] = 0
+    missing = pagerank.doc_ids[positions] != doc_ids
+    if missing.any():
+        raise KeyError(int(doc_ids[missing][0]))
+    return pagerank.scores[positions]
+
+
+def calculate_pagerank_bound(segment_index, term, postings, block):
+    """Return the largest pagerank in a block of a term's postings.
+
+    The block maxima of a posting list are computed the first time its term
+    leads a pruned query and cached in the segment's pagerank_bounds.
+    """
+    pagerank_bounds = segment_index.pagerank_bounds
+    if term not in pagerank_bounds:
+        pagerank_scores = calculate_pagerank_scores(
+            segment_index.pagerank,
+            np.frombuffer(postings.doc_ids, dtype=np.uint32)
+        )
+        pagerank_bounds[term] = np.maximum.reduceat(
+            pagerank_scores,
+            np.arange(0, len(pagerank_scores), index.segment.BLOCK_SIZE),
+        )
+    return pagerank_bounds[term][block]
+
+
+def calculate_tfidf_scores(query_list, documents_contain):
+    """Return the tf-idf score of each candidate document.
+
+    The query vector is built once and each term adds its share of the dot
+    product to every document with one array operation.  Documents score 0
+    if the query or document vector has no length, which happens when all of
+    their terms occur in every document.
+    """
     query_vector = []
-    document_vector = []
-    for term_name, term_dict in document_dict.items():
+    dot_prod = 0.0
+    for term_name, idf_k in documents_contain.idfs.items():
         term_freq_in_query = query_list.count(term_name)
-        idf_k = float(INVERTEDINDEX_DICT[term_name]["idf_k"])
         query_vector.append(term_freq_in_query * idf_k)
-        term_freq_in_doc = term_dict["tf_ik"]
-        document_vector.append(term_freq_in_doc * idf_k)
-    dot_prod = sum([q * d for q, d in zip(query_vector, document_vector)])
+        term_freq_in_doc = np.frombuffer(
+            documents_contain.tfs[term_name], dtype=np.uint32
+        )
+        dot_prod = dot_prod + query_vector[-1] * (term_freq_in_doc * idf_k)
     norm_q_square = 0.0
     for query_norm in query_vector:
         norm_q_square += pow(query_norm, 2)
     norm_q = math.sqrt(norm_q_square)
-    norm_d = math.sqrt(float(document_dict[query_list[0]]["norm"]))
-    tfidf_score = dot_prod / (norm_q * norm_d)
-    return tfidf_score
+    norm_d = np.sqrt(np.frombuffer(documents_contain.norms, dtype=np.float64))
+    denominator = norm_q * norm_d
+    return np.divide(
+        dot_prod, denominator,
+        out=np.zeros_like(denominator), where=denominator > 0,
+    )
@@ -0,0 +1,88 @@
+"""Query result cache for the Index Server.
+
+Rankings are kept in least recently used order under a byte budget.  Every
+entry belongs to the index version it was computed from, so loading a new
+segment drops all of them.
+"""
+import collections
+import sys
+import threading
+
+
+# Approximate size of one cached hit: a (doc_id, score) tuple of an int and
+# a float, plus its slot in the list
+HIT_SIZE = (sys.getsizeof((0, 0.0)) + sys.getsizeof(2**31) +
+            sys.getsizeof(0.0) + 8)
+
+# Approximate size of an entry apart from its hits: the key, the list and the
+# bookkeeping of the ordered dict
+ENTRY_SIZE = 512
+
+
+class ResultCache:
+    """Thread-safe LRU cache of rankings with a memory cap."""
+
+    def __init__(self, max_bytes):
+        """Create an empty cache holding at most about max_bytes."""
+        self.max_bytes = max_bytes
+        self.version = None
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def entry_size(key, hits):
+        """Return the approximate number of bytes an entry takes."""
+        return ENTRY_SIZE + sys.getsizeof(key[0]) + HIT_SIZE * len(hits)
+
+    def clear_version(self, version):
+        """Drop every entry unless the cache already holds version.
+
+        Callers must hold the lock.
+        """
+        if version != self.version:
+            self.entries.clear()
+            self.size = 0
+            self.version = version
+
+    def get(self, version, key):
+        """Return the cached hits for key, or None."""
+        with self.lock:
+            self.clear_version(version)
+            hits = self.entries.get(key)
+            if hits is None:
+                self.counts["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counts["hits"] += 1
+            return hits
+
+    def put(self, version, key, hits):
+        """Cache hits for key, evicting least recently used entries."""
+        size = self.entry_size(key, hits)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self.clear_version(version)
+            if key in self.entries:
+                self.size -= self.entry_size(key, self.entries.pop(key))
+            self.entries[key] = hits
+            self.size += size
+            while self.size > self.max_bytes:
+                old_key, old_hits = self.entries.popitem(last=False)
+                self.size -= self.entry_size(old_key, old_hits)
+                self.counts["evictions"] += 1
+
+    def stats(self):
+        """Return counters describing the cache."""
+        with self.lock:
+            return {
+                "hits": self.counts["hits"],
+                "misses": self.counts["misses"],
+                "evictions": self.counts["evictions"],
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "version": self.version,
+            }
@@ -0,0 +1,146 @@
+"""Conjunctive query evaluation over doc-id-sorted posting lists."""
+import array
+import bisect
+import collections
+from index.segment import BLOCK_SIZE
+
+
+# Documents matching a query.  tfs maps each query term to an array aligned
+# with doc_ids; norms is aligned with doc_ids; idfs maps each term to its idf.
+Candidates = collections.namedtuple(
+    "Candidates", ["doc_ids", "idfs", "tfs", "norms"]
+)
+
+
+def empty_candidates():
+    """Return Candidates with no documents."""
+    return Candidates(array.array("I"), {}, {}, array.array("d"))
+
+
+def gallop(doc_ids, target, low):
+    """Return the first position at or after low whose doc id is >= target.
+
+    Probe positions low, low + 1, low + 3, low + 7, ... until the target is
+    passed, then binary search the last gap.  Skipping ahead costs O(log d)
+    where d is the distance moved, so short lists skip through long ones.
+    """
+    size = len(doc_ids)
+    step = 1
+    high = low
+    while high < size and doc_ids[high] < target:
+        low = high + 1
+        high = low + step
+        step *= 2
+    return bisect.bisect_left(doc_ids, target, low, min(high, size))
+
+
+class Intersection:
+    """Leapfrog intersection of doc-id-sorted posting lists.
+
+    The rarest list leads and the other lists gallop forward to each of its
+    doc ids.  A miss makes the lead gallop to the doc id that was found
+    instead.  Cursors only move forward, so ranges of the lead list can be
+    collected one after another and the ranges in between skipped.
+    """
+
+    def __init__(self, term_postings):
+        """Prepare to intersect term_postings.
+
+        term_postings maps each distinct query term to its TermPostings, in
+        query order; the norm of a match is taken from the first term.
+        """
+        self.terms = list(term_postings)
+        self.lists = [term_postings[term] for term in self.terms]
+        self.order = sorted(
+            range(len(self.lists)), key=lambda i: len(self.lists[i].doc_ids)
+        )
+        self.cursors = [0] * len(self.lists)
+        self.exhausted = False
+
+    @property
+    def lead_term(self):
+        """Return the term with the shortest posting list."""
+        return self.terms[self.order[0]]
+
+    @property
+    def lead(self):
+        """Return the shortest posting list."""
+        return self.lists[self.order[0]]
+
+    def collect(self, start, end):
+        """Return the Candidates among lead postings start to end.
+
+        tf and norm of every match are collected in the same pass.
+        """
+        candidates = Candidates(
+            doc_ids=array.array("I"),
+            idfs={term: postings.idf_k
+                  for term, postings in zip(self.terms, self.lists)},
+            tfs={term: array.array("I") for term in self.terms},
+            norms=array.array("d"),
+        )
+        lead = self.lead.doc_ids
+        lead_pos = start
+        while lead_pos < end:
+            doc_id = lead[lead_pos]
+            self.cursors[self.order[0]] = lead_pos
+            for i in self.order[1:]:
+                doc_ids = self.lists[i].doc_ids
+                self.cursors[i] = gallop(doc_ids, doc_id, self.cursors[i])
+                if self.cursors[i] == len(doc_ids):
+                    self.exhausted = True
+                    return candidates
+                if doc_ids[self.cursors[i]] != doc_id:
+                    lead_pos = gallop(
+                        lead, doc_ids[self.cursors[i]], lead_pos + 1
+                    )
+                    break
+            else:
+                candidates.doc_ids.append(doc_id)
+                for term, postings, cursor in zip(
+                        self.terms, self.lists, self.cursors):
+                    candidates.tfs[term].append(postings.tfs[cursor])
+                candidates.norms.append(self.lists[0].norms[self.cursors[0]])
+                lead_pos += 1
+        return candidates
+
+
+def intersect(term_postings):
+    """Return the Candidates containing every term in term_postings."""
+    intersection = Intersection(term_postings)
+    return intersection.collect(0, len(intersection.lead.doc_ids))
+
+
+def intersect_blocks(term_postings, keep_block):
+    """Yield the Candidates of each block of the rarest posting list.
+
+    Before a block of BLOCK_SIZE lead postings is intersected, keep_block is
+    called with the lead term, the block number and the first and last doc id
+    of the block.  Blocks it rejects are skipped without touching the other
+    posting lists.  keep_block is called lazily, so it sees the effect of the
+    blocks already consumed.
+    """
+    intersection = Intersection(term_postings)
+    lead = intersection.lead.doc_ids
+    for block, start in enumerate(range(0, len(lead), BLOCK_SIZE)):
+        end = min(start + BLOCK_SIZE, len(lead))
+        if not keep_block(intersection.lead_term, block,
+                          lead[start], lead[end - 1]):
+            continue
+        yield intersection.collect(start, end)
+        if intersection.exhausted:
+            return
+
+
+def max_weight_between(postings, first_doc_id, last_doc_id):
+    """Return the largest posting weight among doc ids in a range.
+
+    The bound comes from the block maxima of every block overlapping the
+    range.  Return None if no posting falls in the range.
+    """
+    start = bisect.bisect_left(postings.doc_ids, first_doc_id)
+    end = bisect.bisect_right(postings.doc_ids, last_doc_id)
+    if start == end:
+        return None
+    return max(postings.max_weights[start // BLOCK_SIZE:
+                                    (end - 1) // BLOCK_SIZE + 1])
@@ -0,0 +1,210 @@
+"""Build inverted index segments on one machine.
+
+This produces the same segments as the MapReduce pipeline in
+hadoop/inverted_index, byte for byte, without materializing the output of
+every job on disk.  Documents are tokenized by a pool of processes, then
+document frequencies, idfs, normalization factors and postings are computed
+in memory.  Use it for corpora that fit in the memory of one machine.
+
+    $ python3 -m index.indexer hadoop/inverted_index/example_input/input.csv \
+        index/index/inverted_index
+
+Segment i is written to inverted_index_i.txt and holds the documents whose
+doc_id is i modulo the number of segments.  With --binary the binary segment
+read by the Index Server is written next to each text segment.
+"""
+import argparse
+import collections
+import csv
+import math
+import multiprocessing
+import pathlib
+import re
+import sys
+import index.segment
+
+
+PACKAGE_DIR = pathlib.Path(__file__).parent
+
+# Characters removed from documents before they are split into terms
+NON_ALPHANUMERIC = re.compile(r"[^a-zA-Z0-9 ]+")
+
+# Input lines handed to a tokenizing process at a time
+CHUNK_LINES = 2000
+
+# Stopwords of the tokenizing process, set by init_worker
+STOPWORDS = set()
+
+
+def read_stopwords(stopwords_path):
+    """Return the set of stopwords in stopwords_path."""
+    with open(str(stopwords_path), 'r', encoding='utf-8') as stopfile:
+        return {line.strip().casefold() for line in stopfile}
+
+
+def init_worker(stopwords):
+    """Give a tokenizing process the stopwords."""
+    STOPWORDS.clear()
+    STOPWORDS.update(stopwords)
+
+
+def count_terms(lines):
+    """Return (doc_id, Counter of term frequencies) for each CSV line.
+
+    Each line is parsed on its own, so every line is one document.
+    """
+    csv.field_size_limit(sys.maxsize)
+    docs = []
+    for line in lines:
+        doc_id, doc_title, doc_body = next(csv.reader([line]))[:3]
+        doc_text = NON_ALPHANUMERIC.sub("", doc_title + " " + doc_body)
+        term_freqs = collections.Counter(doc_text.casefold().split())
+        for stopword in STOPWORDS.intersection(term_freqs):
+            del term_freqs[stopword]
+        docs.append((doc_id.strip(), term_freqs))
+    return docs
+
+
+def read_chunks(input_paths):
+    """Yield lists of at most CHUNK_LINES lines of the input files."""
+    for input_path in input_paths:
+        with open(str(input_path), 'r', encoding='utf-8') as inputfile:
+            while True:
+                lines = list(zip(range(CHUNK_LINES), inputfile))
+                if not lines:
+                    break
+                yield [line for _, line in lines]
+
+
+def tokenize(input_paths, stopwords, processes):
+    """Return (number of documents, dict of term frequencies by doc_id).
+
+    The input is tokenized by a pool of processes.  Lines with the same
+    doc_id are counted as one document, as the pipeline does.
+    """
+    num_docs = 0
+    docs = {}
+    with multiprocessing.Pool(processes, init_worker, (stopwords,)) as pool:
+        for chunk_docs in pool.imap(count_terms, read_chunks(input_paths)):
+            num_docs += len(chunk_docs)
+            for doc_id, term_freqs in chunk_docs:
+                if doc_id in docs:
+                    docs[doc_id].update(term_freqs)
+                else:
+                    docs[doc_id] = term_freqs
+    return num_docs, docs
+
+
+def calculate_idfs(num_docs, docs):
+    """Return the idf of every term, log10 of num_docs over its df."""
+    doc_freqs = collections.Counter()
+    for term_freqs in docs.values():
+        doc_freqs.update(term_freqs.keys())
+    return {
+        term: math.log(num_docs / doc_freq, 10)
+        for term, doc_freq in doc_freqs.items()
+    }
+
+
+def calculate_norm(term_freqs, idfs):
+    """Return the squared length of a document's tf-idf vector.
+
+    Weights are added one at a time in term order, like the pipeline, so the
+    sum rounds the same way.
+    """
+    norm = 0.0
+    for term in sorted(term_freqs):
+        norm += pow(term_freqs[term] * idfs[term], 2)
+    return norm
+
+
+def build_postings(docs, idfs, num_segments):
+    """Return a dict of postings by term for each segment.
+
+    A posting is (doc_id, tf_ik, norm), with doc_id as given in the input.
+    """
+    segments = [collections.defaultdict(list) for _ in range(num_segments)]
+    for doc_id, term_freqs in docs.items():
+        norm = calculate_norm(term_freqs, idfs)
+        postings = segments[int(doc_id) % num_segments]
+        for term, tf_ik in term_freqs.items():
+            postings[term].append((doc_id, tf_ik, norm))
+    return segments
+
+
+def write_text_segment(postings, idfs, text_path):
+    """Write a segment in the text format of the pipeline.
+
+    Terms are sorted, and postings are sorted by doc_id as a string.  The
+    file is written to a temporary name and renamed so that readers never see
+    a partial segment.
+    """
+    with index.segment.replace_atomically(
+            text_path, 'w', encoding='utf-8') as indexfile:
+        for term in sorted(postings):
+            postings_str = " ".join(
+                f"{doc_id} {tf_ik} {norm}"
+                for doc_id, tf_ik, norm in sorted(postings[term])
+            )
+            indexfile.write(f"{term} {idfs[term]} {postings_str}\n")
+
+
+def build_index(input_paths, output_dir, stopwords_path,
+                num_segments=3, processes=None):
+    """Build num_segments text segments from CSV input files.
+
+    Return the paths of the segments written to output_dir.
+    """
+    num_docs, docs = tokenize(
+        input_paths, read_stopwords(stopwords_path), processes
+    )
+    idfs = calculate_idfs(num_docs, docs)
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    text_paths = []
+    for segment_id, postings in enumerate(
+            build_postings(docs, idfs, num_segments)):
+        text_path = output_dir / f"inverted_index_{segment_id}.txt"
+        write_text_segment(postings, idfs, text_path)
+        text_paths.append(text_path)
+    return text_paths
+
+
+def input_files(input_path):
+    """Return the files to read for an input file or directory."""
+    input_path = pathlib.Path(input_path)
+    if input_path.is_dir():
+        return sorted(path for path in input_path.iterdir() if path.is_file())
+    return [input_path]
+
+
+def main():
+    """Build the segments described on the command line."""
+    parser = argparse.ArgumentParser(
+        description="Build inverted index segments on one machine."
+    )
+    parser.add_argument("input", help="CSV file or directory of CSV files "
+                                      "with doc_id, title and body columns")
+    parser.add_argument("output_dir")
+    parser.add_argument("--segments", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=None,
+                        help="tokenizing processes, by default one per CPU")
+    parser.add_argument("--stopwords", default=PACKAGE_DIR/"stopwords.txt")
+    parser.add_argument("--binary", action="store_true",
+                        help="also write binary segments")
+    args = parser.parse_args()
+    if args.segments < 1:
+        parser.error("--segments must be at least 1")
+    text_paths = build_index(
+        input_files(args.input), args.output_dir, args.stopwords,
+        args.segments, args.processes,
+    )
+    if args.binary:
+        for text_path in text_paths:
+            index.segment.write_segment(
+                text_path, text_path.with_suffix(index.segment.SEGMENT_SUFFIX)
+            )
+
+
+if __name__ == "__main__":
+    main()
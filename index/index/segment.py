@@ -0,0 +1,336 @@
+"""Binary inverted index segments.
+
+A segment file holds one inverted index segment in a compact layout that the
+Index Server memory-maps instead of parsing.  Every section starts on an 8-byte
+boundary so it can be viewed as a typed array without copying.  Integers and
+floats use the native byte order of the machine that built the file.
+
+    header          magic, version, number of terms, number of postings and
+                    the byte offset of every section below
+    term_offsets    uint64[num_terms + 1]   offsets into term_strings
+    term_strings    UTF-8 terms, concatenated in sorted order
+    idfs            float64[num_terms]
+    posting_starts  uint64[num_terms + 1]   index of each term's first posting
+    doc_ids         uint32[num_postings]    ascending within each term
+    tfs             uint32[num_postings]
+    norms           float64[num_postings]
+    block_starts    uint64[num_terms + 1]   index of each term's first block
+    max_weights     float64[num_blocks]     largest tf * idf / sqrt(norm) in
+                                            each block of BLOCK_SIZE postings
+
+The block maxima bound the tf-idf score a posting can contribute, which lets
+query evaluation skip blocks that cannot reach the top k.
+
+Build a segment from the text format written by the MapReduce pipeline with:
+
+    $ python3 -m index.segment index/index/inverted_index/inverted_index_0.txt
+"""
+import array
+import collections.abc
+import contextlib
+import math
+import mmap
+import os
+import pathlib
+import struct
+import sys
+import tempfile
+
+
+MAGIC = b"IIDX"
+VERSION = 2
+SEGMENT_SUFFIX = ".seg"
+
+# Number of postings summarized by each entry of max_weights
+BLOCK_SIZE = 128
+
+# magic, version, num_terms, num_postings, then one offset per section
+HEADER = struct.Struct("=4sIQQ10Q")
+
+MAX_UINT32 = 2**32 - 1
+
+# Postings of one term.  idf_k is a float, doc_ids, tfs and norms are
+# parallel typed arrays ordered by doc_id and max_weights holds the block
+# maxima of tf * idf / sqrt(norm).
+TermPostings = collections.namedtuple(
+    "TermPostings", ["idf_k", "doc_ids", "tfs", "norms", "max_weights"]
+)
+
+# Typed views of the sections of a mapped segment file
+Sections = collections.namedtuple("Sections", [
+    "term_offsets", "term_strings", "idfs", "posting_starts",
+    "doc_ids", "tfs", "norms", "block_starts", "max_weights",
+])
+SECTION_TYPECODES = ["Q", "B", "d", "Q", "I", "I", "d", "Q", "d"]
+
+
+class SegmentError(Exception):
+    """Raised when a segment file is missing or malformed."""
+
+
+def align(offset):
+    """Round offset up to the next multiple of 8."""
+    return (offset + 7) & ~7
+
+
+def read_text_segment(text_path):
+    """Parse a text inverted index segment into typed arrays.
+
+    Each line of the text format is "term idf_k doc_id tf_ik norm ...".
+    Postings are sorted by numeric doc_id.  Return (terms, idfs,
+    posting_starts, doc_ids, tfs, norms).
+    """
+    terms = []
+    idfs = array.array("d")
+    posting_starts = array.array("Q", [0])
+    doc_ids = array.array("I")
+    tfs = array.array("I")
+    norms = array.array("d")
+    with open(str(text_path), 'r', encoding='utf-8') as indexfile:
+        for line in indexfile:
+            term_info_list = line.split()
+            if not term_info_list:
+                continue
+            terms.append(term_info_list[0])
+            idfs.append(float(term_info_list[1]))
+            postings = sorted(
+                (int(term_info_list[i]), int(term_info_list[i + 1]),
+                 float(term_info_list[i + 2]))
+                for i in range(2, len(term_info_list), 3)
+            )
+            for doc_id, tf_ik, norm in postings:
+                if doc_id > MAX_UINT32:
+                    raise SegmentError(f"{text_path}: doc_id {doc_id} "
+                                       "does not fit in 32 bits")
+                doc_ids.append(doc_id)
+                tfs.append(tf_ik)
+                norms.append(norm)
+            posting_starts.append(len(doc_ids))
+    return terms, idfs, posting_starts, doc_ids, tfs, norms
+
+
+def posting_weight(tf_ik, idf_k, norm):
+    """Return the tf-idf weight of a posting, normalized by its document."""
+    if norm <= 0.0:
+        return math.inf
+    return tf_ik * idf_k / math.sqrt(norm)
+
+
+def block_max_weights(idfs, posting_starts, tfs, norms):
+    """Return (block_starts, max_weights) summarizing each term's postings.
+
+    Each term's postings are cut into blocks of BLOCK_SIZE and the largest
+    posting_weight of every block is recorded.
+    """
+    block_starts = array.array("Q", [0])
+    max_weights = array.array("d")
+    for term_id, idf_k in enumerate(idfs):
+        term_end = posting_starts[term_id + 1]
+        for start in range(posting_starts[term_id], term_end, BLOCK_SIZE):
+            max_weights.append(max(
+                posting_weight(tfs[i], idf_k, norms[i])
+                for i in range(start, min(start + BLOCK_SIZE, term_end))
+            ))
+        block_starts.append(len(max_weights))
+    return block_starts, max_weights
+
+
+def term_dictionary(terms, text_path):
+    """Return (term_offsets, term_strings) for a sorted list of terms."""
+    # Terms are looked up with a binary search, so they must be sorted
+    encoded_terms = [term.encode("utf-8") for term in terms]
+    if any(prev >= curr
+           for prev, curr in zip(encoded_terms, encoded_terms[1:])):
+        raise SegmentError(f"{text_path}: terms are not sorted")
+    term_offsets = array.array("Q", [0])
+    for encoded_term in encoded_terms:
+        term_offsets.append(term_offsets[-1] + len(encoded_term))
+    return term_offsets, b"".join(encoded_terms)
+
+
+def write_segment(text_path, segment_path):
+    """Convert a text inverted index segment into the binary format.
+
+    The file is written to a temporary name and renamed so that readers never
+    see a partial segment.
+    """
+    terms, idfs, posting_starts, doc_ids, tfs, norms = \
+        read_text_segment(text_path)
+    sections = [
+        *term_dictionary(terms, text_path),
+        idfs, posting_starts, doc_ids, tfs, norms,
+        *block_max_weights(idfs, posting_starts, tfs, norms),
+    ]
+    offsets = []
+    position = HEADER.size
+    for section in sections:
+        position = align(position)
+        offsets.append(position)
+        position += len(memoryview(section).cast("B"))
+    offsets.append(position)
+
+    with replace_atomically(segment_path, 'wb') as segfile:
+        segfile.write(HEADER.pack(
+            MAGIC, VERSION, len(terms), len(doc_ids), *offsets
+        ))
+        for offset, section in zip(offsets, sections):
+            segfile.write(b"\0" * (offset - segfile.tell()))
+            segfile.write(section)
+
+
+@contextlib.contextmanager
+def replace_atomically(path, mode, **open_args):
+    """Return a new temporary file that replaces path once it is written.
+
+    The file gets a unique name next to path, so that processes writing the
+    same path at once do not write into each other's file.  It is removed if
+    writing fails.
+    """
+    path = pathlib.Path(path)
+    file_descriptor, tmp_name = tempfile.mkstemp(
+        prefix=path.name + ".", suffix=".tmp", dir=str(path.parent)
+    )
+    try:
+        # mkstemp makes the file private, unlike open()
+        os.chmod(tmp_name, 0o644)
+        with os.fdopen(file_descriptor, mode, **open_args) as tmpfile:
+            yield tmpfile
+        os.replace(tmp_name, str(path))
+    finally:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+
+
+class Segment(collections.abc.Mapping):
+    """Read-only, memory-mapped view of a binary segment.
+
+    Maps a term to its TermPostings.  Nothing is parsed up front: lookups
+    binary search the term dictionary and return typed views of the postings
+    in the mapped file, so no per-posting Python objects are created.
+    """
+
+    def __init__(self, path):
+        """Map the segment file at path."""
+        self.path = pathlib.Path(path)
+        try:
+            with open(str(self.path), 'rb') as segfile:
+                self._mmap = mmap.mmap(
+                    segfile.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        except (OSError, ValueError) as err:
+            raise SegmentError(f"{self.path}: {err}") from err
+        if len(self._mmap) < HEADER.size:
+            raise SegmentError(f"{self.path}: truncated header")
+        (magic, version, self.num_terms, self.num_postings,
+         *offsets) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise SegmentError(f"{self.path}: not a version {VERSION} segment")
+        if offsets[-1] != len(self._mmap):
+            raise SegmentError(f"{self.path}: size does not match header")
+
+        buffer = memoryview(self._mmap)
+        self.sections = Sections(*(
+            buffer[start:end].cast(typecode)
+            for start, end, typecode
+            in zip(offsets, offsets[1:], SECTION_TYPECODES)
+        ))
+        buffer.release()
+
+    def term_bytes(self, term_id):
+        """Return the UTF-8 encoded term stored at position term_id."""
+        term_offsets = self.sections.term_offsets
+        start = term_offsets[term_id]
+        end = term_offsets[term_id + 1]
+        return self.sections.term_strings[start:end].tobytes()
+
+    def find(self, term):
+        """Return the position of term in the dictionary, or -1."""
+        key = term.encode("utf-8")
+        low, high = 0, self.num_terms
+        while low < high:
+            mid = (low + high) // 2
+            if self.term_bytes(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.num_terms and self.term_bytes(low) == key:
+            return low
+        return -1
+
+    def __contains__(self, term):
+        """Return True if term has postings in this segment."""
+        return isinstance(term, str) and self.find(term) >= 0
+
+    def __getitem__(self, term):
+        """Return the TermPostings of term, viewed in the mapped file."""
+        term_id = self.find(term) if isinstance(term, str) else -1
+        if term_id < 0:
+            raise KeyError(term)
+        sections = self.sections
+        start = sections.posting_starts[term_id]
+        end = sections.posting_starts[term_id + 1]
+        block_start = sections.block_starts[term_id]
+        block_end = sections.block_starts[term_id + 1]
+        return TermPostings(
+            idf_k=sections.idfs[term_id],
+            doc_ids=sections.doc_ids[start:end],
+            tfs=sections.tfs[start:end],
+            norms=sections.norms[start:end],
+            max_weights=sections.max_weights[block_start:block_end],
+        )
+
+    def __iter__(self):
+        """Iterate over terms in sorted order."""
+        for term_id in range(self.num_terms):
+            yield self.term_bytes(term_id).decode("utf-8")
+
+    def __len__(self):
+        """Return the number of terms."""
+        return self.num_terms
+
+    def close(self):
+        """Release the typed views and unmap the file.
+
+        Postings returned by earlier lookups are views into the mapping, so
+        they must no longer be referenced.
+        """
+        for view in self.sections:
+            view.release()
+        self._mmap.close()
+
+
+def load_segment(path):
+    """Return a mapped Segment for path.
+
+    path may name a binary segment or a text segment.  For a text segment the
+    binary file next to it is used, and rebuilt first if it is missing, older
+    than the text file or written by another version of this module.
+    """
+    path = pathlib.Path(path)
+    if path.suffix == SEGMENT_SUFFIX:
+        return Segment(path)
+    segment_path = path.with_suffix(SEGMENT_SUFFIX)
+    if path.exists() and (
+            not segment_path.exists() or
+            segment_path.stat().st_mtime < path.stat().st_mtime):
+        write_segment(path, segment_path)
+    try:
+        return Segment(segment_path)
+    except SegmentError:
+        if not path.exists():
+            raise
+    write_segment(path, segment_path)
+    return Segment(segment_path)
+
+
+def main():
+    """Build a binary segment for each text segment on the command line."""
+    if len(sys.argv) < 2:
+        sys.exit(f"Usage: {sys.argv[0]} INVERTED_INDEX_TXT...")
+    for text_path in sys.argv[1:]:
+        text_path = pathlib.Path(text_path)
+        write_segment(text_path, text_path.with_suffix(SEGMENT_SUFFIX))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Serve several inverted index segments from one Index Server process.
+
+INDEX_PATH names the segments separated by commas.  Segment i is served on
+the i-th port at the usual /api/v1/hits/ URL, so Search Server configuration
+does not change.  One extra port may be given; it serves the top-k of all
+segments, searched in parallel and merged.  Stopwords and pagerank are loaded
+once and shared by every segment.
+
+    $ cd index
+    $ INDEX_PATH=inverted_index_0.txt,inverted_index_1.txt \
+        python3 -m index.server 9000 9001
+
+bin/index starts the three segments this way when INDEX_SERVER_MODE=single.
+"""
+import argparse
+import threading
+import werkzeug.serving
+import index
+import index.api.main
+
+
+def select_segments(app, positions):
+    """Return WSGI middleware making app search only the segments given."""
+    def selected_app(environ, start_response):
+        environ[index.api.main.SEGMENTS_ENVIRON_KEY] = positions
+        return app(environ, start_response)
+    return selected_app
+
+
+def make_servers(host, ports):
+    """Return a threaded WSGI server for each port.
+
+    The first len(segments) ports serve one segment each and a remaining port
+    serves all segments.
+    """
+    num_segments = len(index.app.config["INDEX_PATH"].split(","))
+    if len(ports) not in (num_segments, num_segments + 1):
+        raise ValueError(
+            f"expected {num_segments} or {num_segments + 1} ports "
+            f"for {num_segments} segments, got {len(ports)}"
+        )
+    servers = []
+    for position, port in enumerate(ports):
+        app = index.app
+        if position < num_segments:
+            app = select_segments(index.app, (position,))
+        servers.append(
+            werkzeug.serving.make_server(host, port, app, threaded=True)
+        )
+    return servers
+
+
+def main():
+    """Serve the configured segments until interrupted."""
+    parser = argparse.ArgumentParser(
+        description="Serve several index segments from one process."
+    )
+    parser.add_argument("ports", type=int, nargs="+",
+                        help="one port per segment and optionally a port "
+                             "serving all segments")
+    parser.add_argument("--host", default="0.0.0.0")
+    args = parser.parse_args()
+    if not index.app.config["INDEX_PATH"]:
+        parser.error("INDEX_PATH is not set")
+    try:
+        servers = make_servers(args.host, args.ports)
+    except ValueError as err:
+        parser.error(str(err))
+    for server in servers[1:]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        servers[0].serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Loaded index versions and the requests using them.
+
+Everything the Index Server loads from one index directory is kept in one
+IndexState, so a new version can replace the old one with a single
+assignment.  A replaced state is retired: requests that already hold it
+finish on it, and its segments are unmapped when the last one releases it.
+"""
+import threading
+
+
+class IndexState:
+    """Stopwords, pagerank and segments loaded from one index directory."""
+
+    def __init__(self, index_dir, stopwords, pagerank, segments, result_cache):
+        """Wrap the structures loaded from index_dir.
+
+        segments is a list of SegmentIndex.  The version identifies the
+        directory and every segment file in it.
+        """
+        self.stopwords = stopwords
+        self.pagerank = pagerank
+        self.segments = segments
+        self.result_cache = result_cache
+        self.version = index_dir.name + ":" + "+".join(
+            segment_index.version for segment_index in segments
+        )
+        # Number of requests using this state, and whether it was replaced
+        self.usage = {"in_flight": 0, "retired": False}
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Register a request, return False if the state was retired."""
+        with self.lock:
+            if self.usage["retired"]:
+                return False
+            self.usage["in_flight"] += 1
+            return True
+
+    def release(self):
+        """Unregister a request, closing the state if it was the last."""
+        with self.lock:
+            self.usage["in_flight"] -= 1
+            drained = (self.usage["retired"] and
+                       self.usage["in_flight"] == 0)
+        if drained:
+            self.close()
+
+    def retire(self):
+        """Stop new requests from acquiring the state, close it when unused."""
+        with self.lock:
+            self.usage["retired"] = True
+            drained = self.usage["in_flight"] == 0
+        if drained:
+            self.close()
+
+    def in_flight(self):
+        """Return the number of requests using the state."""
+        with self.lock:
+            return self.usage["in_flight"]
+
+    def close(self):
+        """Unmap the segments."""
+        for segment_index in self.segments:
+            try:
+                segment_index.segment.close()
+            except BufferError:
+                # Postings are still referenced somewhere, for example by a
+                # traceback.  The mapping is freed with the last reference.
+                pass
@@ -0,0 +1,174 @@
+"""Document metadata and result page caches for the Search Server.
+
+The url, title and summary of recently shown documents are kept in least
+recently used order under a byte budget, so result pages for popular queries
+are rendered without querying the database.  Rendered result pages are kept
+the same way for a limited time, and dropped when the index version changes.
+"""
+import collections
+import hashlib
+import sys
+import threading
+import time
+
+
+# Approximate size of an entry apart from its strings: the docid, the dict
+# and the bookkeeping of the ordered dict
+ENTRY_SIZE = 400
+
+# Approximate size of a page entry apart from its body: the key, the Page
+# and the bookkeeping of the ordered dict
+PAGE_ENTRY_SIZE = 600
+
+# A rendered page, its entity tag and the monotonic time it expires at
+Page = collections.namedtuple("Page", ["body", "etag", "expires"])
+
+
+class LRUCache:
+    """Thread-safe LRU map with a memory cap, tied to a data version.
+
+    Subclasses give the approximate size of an entry.  A cache may hold the
+    entries of one version of the data they come from: a lookup or store for
+    another version drops all of them first.
+    """
+
+    def __init__(self, max_bytes):
+        """Create an empty cache holding at most about max_bytes."""
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.max_bytes = max_bytes
+        self.version = None
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def entry_size(self, key, value):
+        """Return the approximate number of bytes an entry takes."""
+        raise NotImplementedError
+
+    def clear_version(self, version):
+        """Drop every entry unless the cache already holds version.
+
+        Callers must hold the lock.
+        """
+        if version != self.version:
+            self.version = version
+            self.entries.clear()
+            self.size = 0
+
+    def lookup(self, key):
+        """Return the value for key and mark it recently used, or None.
+
+        Callers must hold the lock.
+        """
+        if key not in self.entries:
+            self.counts["misses"] += 1
+            return None
+        self.counts["hits"] += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def store(self, key, value):
+        """Store value for key, evicting least recently used entries.
+
+        Values larger than the whole cache are not stored.  Callers must hold
+        the lock.
+        """
+        size = self.entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= self.entry_size(key, self.entries.pop(key))
+        self.entries[key] = value
+        self.size += size
+        while self.size > self.max_bytes:
+            self.size -= self.entry_size(*self.entries.popitem(last=False))
+            self.counts["evictions"] += 1
+
+    def stats(self):
+        """Return counters describing the cache."""
+        with self.lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            return {
+                **self.counts,
+                "hits": self.counts["hits"],
+                "misses": self.counts["misses"],
+                "hit_rate": self.counts["hits"] / lookups if lookups else 0.0,
+                "evictions": self.counts["evictions"],
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class DocumentCache(LRUCache):
+    """Thread-safe LRU cache of document metadata keyed by docid.
+
+    Every document belongs to the version of the database file it was read
+    from.
+    """
+
+    def entry_size(self, key, value):
+        """Return the approximate number of bytes a document takes."""
+        return ENTRY_SIZE + sum(
+            sys.getsizeof(field) for field in value.values()
+        )
+
+    def get_many(self, version, doc_ids):
+        """Return a dict of the cached documents among doc_ids."""
+        docs = {}
+        with self.lock:
+            self.clear_version(version)
+            for doc_id in doc_ids:
+                doc = self.lookup(doc_id)
+                if doc is not None:
+                    docs[doc_id] = doc
+        return docs
+
+    def put_many(self, version, docs):
+        """Cache a dict of documents, evicting least recently used ones."""
+        with self.lock:
+            self.clear_version(version)
+            for doc_id, doc in docs.items():
+                self.store(doc_id, doc)
+
+
+class PageCache(LRUCache):
+    """Thread-safe LRU cache of rendered pages with a TTL and a memory cap.
+
+    Every page belongs to the index version it was rendered from.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        """Create an empty cache holding at most about max_bytes.
+
+        Pages expire ttl seconds after they are cached.
+        """
+        super().__init__(max_bytes)
+        self.ttl = ttl
+        self.counts["expirations"] = 0
+
+    def entry_size(self, key, value):
+        """Return the approximate number of bytes a page takes."""
+        return PAGE_ENTRY_SIZE + sys.getsizeof(key[0]) + len(value.body)
+
+    def get(self, version, key):
+        """Return the cached Page for key, or None."""
+        with self.lock:
+            self.clear_version(version)
+            page = self.entries.get(key)
+            if page is not None and page.expires <= time.monotonic():
+                self.size -= self.entry_size(key, self.entries.pop(key))
+                self.counts["expirations"] += 1
+            return self.lookup(key)
+
+    def put(self, version, key, body):
+        """Cache body for key, evicting least recently used pages.
+
+        Return the cached Page.
+        """
+        page = Page(body, hashlib.sha1(body).hexdigest(),
+                    time.monotonic() + self.ttl)
+        with self.lock:
+            self.clear_version(version)
+            self.store(key, page)
+        return page
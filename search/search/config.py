@@ -6,10 +6,65 @@ SEARCH_SERVER_ROOT = pathlib.Path(__file__).resolve().parent.parent
 
 DATABASE_FILENAME = SEARCH_SERVER_ROOT / "search" / "var" / "index.sqlite3"
 
+# Read-only database connections kept open between requests
+DATABASE_POOL_SIZE = 8
+
+# Per connection: bytes of the file to memory-map, page cache size in KiB
+# (negative values are KiB in SQLite) and prepared statements to keep
+DATABASE_MMAP_SIZE = 256 * 1024 * 1024
+DATABASE_CACHE_SIZE = -16 * 1024
+DATABASE_CACHED_STATEMENTS = 128
+
+# Memory budget of the document metadata cache, in bytes
+SEARCH_DOC_CACHE_BYTES = 32 * 1024 * 1024
+
+# Optional pagerank.out whose top documents are cached when the server
+# starts, for example SEARCH_SERVER_ROOT.parent/"index"/"index"/"pagerank.out"
+SEARCH_DOC_CACHE_WARMUP_PATH = None
+SEARCH_DOC_CACHE_WARMUP_DOCS = 10000
+
+# Memory budget of the rendered result page cache in bytes, and seconds a
+# page is served from it
+SEARCH_PAGE_CACHE_BYTES = 16 * 1024 * 1024
+SEARCH_PAGE_CACHE_SECONDS = 60
+
+# Hits API of each index segment.  An entry may also be a list of the URLs of
+# several replicas serving the same segment.
 SEARCH_INDEX_SEGMENT_API_URLS = [
     "http://localhost:9000/api/v1/hits/",
     "http://localhost:9001/api/v1/hits/",
     "http://localhost:9002/api/v1/hits/",
 ]
 
-HIT_CONTEXT_LIST = []
+# Number of results on each page
+SEARCH_PAGE_SIZE = 10
+
+# Last page of results that may be requested, counting from 0.  Deeper
+# pages show the last one.
+SEARCH_MAX_PAGE = 99
+
+# Most hits one request to the search API may ask for, and the deepest offset
+# in the ranking it may start at
+SEARCH_API_MAX_K = 1000
+SEARCH_API_MAX_OFFSET = 10000
+
+# Seconds to wait for each Index Server: (connect, read)
+SEARCH_INDEX_TIMEOUT = (1.0, 5.0)
+
+# Seconds a search waits for the Index Servers.  Segments that have not
+# answered by then are left out and the page says so.
+SEARCH_DEADLINE_SECONDS = 2.0
+
+# Percentile of a segment's recent latencies after which a hedged request is
+# sent to another replica
+SEARCH_HEDGE_PERCENTILE = 95
+
+# Requests sent per segment counting hedged and retried ones, failed requests
+# in a row that eject a replica, and seconds between health checks (0
+# disables)
+SEARCH_INDEX_ATTEMPTS = 2
+SEARCH_REPLICA_MAX_FAILURES = 3
+SEARCH_HEALTH_CHECK_SECONDS = 5.0
+
+# Threads and pooled connections for requests to the Index Servers
+SEARCH_INDEX_WORKERS = 32
@@ -1,45 +1,103 @@
 """Search Server model (database) API."""
+import os
+import pathlib
+import queue
 import sqlite3
 import flask
 import search
 
 
-def dict_factory(cursor, row):
-    """Convert database row objects to a dictionary keyed on column name.
+# Idle read-only connections, reused by later requests, each with the
+# version of the database file it was opened on
+DB_POOL = queue.LifoQueue()
 
-    This is useful for building dictionaries which are then used to render a
-    template.  Note that this would be inefficient for large queries.
+
+def database_version():
+    """Return the identity and modification time of the database file.
+
+    The version changes when the file is replaced or written, for example by
+    bin/indexdb reset.  Return None if there is no database file.
     """
-    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+    try:
+        stat = os.stat(search.app.config['DATABASE_FILENAME'])
+    except FileNotFoundError:
+        return None
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+
+
+def connect_db():
+    """Open a long-lived, read-only connection tuned for lookups.
+
+    The connection may be used by any thread, one request at a time.
+    """
+    db_filename = search.app.config['DATABASE_FILENAME']
+    connection = sqlite3.connect(
+        pathlib.Path(db_filename).resolve().as_uri() + "?mode=ro",
+        uri=True,
+        check_same_thread=False,
+        cached_statements=search.app.config['DATABASE_CACHED_STATEMENTS'],
+    )
+    # Rows are indexed by column name without building a dict per row
+    connection.row_factory = sqlite3.Row
+    connection.execute(
+        f"PRAGMA mmap_size = {int(search.app.config['DATABASE_MMAP_SIZE'])}"
+    )
+    connection.execute(
+        f"PRAGMA cache_size = {int(search.app.config['DATABASE_CACHE_SIZE'])}"
+    )
+    connection.execute("PRAGMA query_only = ON")
+    return connection
 
 
 def get_db():
-    """Open a new database connection.
+    """Return a database connection for this request.
+
+    Connections are taken from DB_POOL, or opened if none is idle.
 
     Flask docs:
     https://flask.palletsprojects.com/en/1.0.x/appcontext/#storing-data
     """
     if 'sqlite_db' not in flask.g:
-        db_filename = search.app.config['DATABASE_FILENAME']
-        flask.g.sqlite_db = sqlite3.connect(str(db_filename))
-        flask.g.sqlite_db.row_factory = dict_factory
-
-        # Foreign keys have to be enabled per-connection.  This is an sqlite3
-        # backwards compatibility thing.
-        flask.g.sqlite_db.execute("PRAGMA foreign_keys = ON")
+        flask.g.sqlite_db_version = database_version()
+        flask.g.sqlite_db = take_pooled_db(flask.g.sqlite_db_version)
+        if flask.g.sqlite_db is None:
+            flask.g.sqlite_db = connect_db()
 
     return flask.g.sqlite_db
 
 
+def take_pooled_db(version):
+    """Return an idle connection to version of the database, or None.
+
+    Idle connections to an older version of the database file are closed,
+    as they would keep reading the replaced file.
+    """
+    while True:
+        try:
+            pooled_version, connection = DB_POOL.get_nowait()
+        except queue.Empty:
+            return None
+        if pooled_version == version:
+            return connection
+        connection.close()
+
+
 @search.app.teardown_appcontext
 def close_db(error):
-    """Close the database at the end of a request.
+    """Return the database connection to the pool at the end of a request.
+
+    Nothing is written, so there is nothing to commit.  Connections beyond
+    DATABASE_POOL_SIZE are closed.
 
     Flask docs:
     https://flask.palletsprojects.com/en/1.0.x/appcontext/#storing-data
     """
     assert error or not error  # Needed to avoid superfluous style error
     sqlite_db = flask.g.pop('sqlite_db', None)
-    if sqlite_db is not None:
-        sqlite_db.commit()
+    sqlite_db_version = flask.g.pop('sqlite_db_version', None)
+    if sqlite_db is None:
+        return
+    if DB_POOL.qsize() < search.app.config['DATABASE_POOL_SIZE']:
+        DB_POOL.put((sqlite_db_version, sqlite_db))
+    else:
         sqlite_db.close()
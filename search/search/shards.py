@@ -0,0 +1,144 @@
+"""Index Server shards and their replicas.
+
+Each segment of the inverted index is a shard served by one or more replica
+Index Servers.  Requests go to the less busy of two randomly chosen healthy
+replicas.  A replica that fails several requests in a row is ejected until a
+health check finds it ready again.  Each shard also tracks the latency of its
+recent requests, so slow requests can be hedged on another replica.
+"""
+import collections
+import random
+import threading
+import urllib.parse
+
+
+# Successful requests per shard whose latency is kept, and the fewest needed
+# before requests are hedged
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class Replica:
+    """One Index Server serving a shard.
+
+    Replicas are changed by their Shard, which holds the lock.
+    """
+
+    def __init__(self, hits_url):
+        """Describe the Index Server whose hits API is at hits_url."""
+        self.hits_url = hits_url
+        self.ready_url = urllib.parse.urljoin(hits_url, "/api/v1/ready/")
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+        # Index version the replica last reported
+        self.version = None
+
+    def finish(self, succeeded, max_failures):
+        """Record the end of a request, ejecting after max_failures."""
+        self.outstanding -= 1
+        if succeeded:
+            self.set_health(True)
+            return
+        self.failures += 1
+        if self.failures >= max_failures:
+            self.healthy = False
+
+    def set_health(self, healthy):
+        """Record whether the replica should receive requests."""
+        self.healthy = healthy
+        if healthy:
+            self.failures = 0
+
+
+class Shard:
+    """The replicas of one segment, balanced on outstanding requests."""
+
+    def __init__(self, hits_urls, max_failures):
+        """Create a shard served at each of hits_urls.
+
+        A replica is ejected after max_failures failed requests in a row.
+        """
+        self.replicas = [Replica(hits_url) for hits_url in hits_urls]
+        self.max_failures = max_failures
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.lock = threading.Lock()
+
+    def choose(self, exclude=()):
+        """Return a replica for a new request, or None if all are excluded.
+
+        Of two random healthy replicas, the one with fewer outstanding
+        requests is chosen.  If every replica has been ejected they are all
+        tried anyway, so that a recovered shard is found without waiting for
+        a health check.  The caller must pass the replica to finish.
+        """
+        with self.lock:
+            candidates = [
+                replica for replica in self.replicas
+                if replica.healthy and replica not in exclude
+            ]
+            if not candidates:
+                candidates = [
+                    replica for replica in self.replicas
+                    if replica not in exclude
+                ]
+            if not candidates:
+                return None
+            replica = min(
+                random.sample(candidates, min(2, len(candidates))),
+                key=lambda replica: replica.outstanding,
+            )
+            replica.outstanding += 1
+            return replica
+
+    def finish(self, replica, succeeded, seconds):
+        """Record the end of a request to replica that took seconds."""
+        with self.lock:
+            replica.finish(succeeded, self.max_failures)
+            if succeeded:
+                self.latencies.append(seconds)
+
+    def set_version(self, replica, version):
+        """Record the index version replica reported."""
+        with self.lock:
+            replica.version = version
+
+    def versions(self):
+        """Return each replica's URL and the index version it last reported.
+
+        The URLs tell shards with no reported versions apart.
+        """
+        with self.lock:
+            return tuple(
+                (replica.hits_url, replica.version)
+                for replica in self.replicas
+            )
+
+    def hedge_delay(self, percentile):
+        """Return the percentile of recent request latencies in seconds.
+
+        Return None until enough requests have succeeded.
+        """
+        with self.lock:
+            if len(self.latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+        rank = round(percentile / 100 * (len(latencies) - 1))
+        return latencies[rank]
+
+    def set_health(self, replica, healthy):
+        """Record the result of a health check of replica."""
+        with self.lock:
+            replica.set_health(healthy)
+
+
+def build_shards(urls_config, max_failures):
+    """Return a Shard for each entry of urls_config.
+
+    An entry is the hits URL of one Index Server or a list of the hits URLs
+    of several replicas.
+    """
+    return [
+        Shard([urls] if isinstance(urls, str) else urls, max_failures)
+        for urls in urls_config
+    ]
@@ -1,2 +1,4 @@
 """Search Server APIs."""
 from search.views.views import get_search
+from search.views.views import get_search_api
+from search.views.views import get_stats
@@ -1,17 +1,92 @@
 """Search Server main code."""
-import threading
+import concurrent.futures
+import copy
 import heapq
+import itertools
+import math
+import threading
+import time
 import requests
-from flask import (request, render_template)
+import requests.adapters
+from flask import (abort, jsonify, make_response, request, render_template)
 import search
+import search.cache
+import search.shards
+
+
+# Threads sending requests to the Index Servers, shared by all searches
+INDEX_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=search.app.config["SEARCH_INDEX_WORKERS"],
+    thread_name_prefix="index-client",
+)
+
+# Keep-alive connections to the Index Servers, reused across searches
+INDEX_SESSION = requests.Session()
+INDEX_SESSION.mount("http://", requests.adapters.HTTPAdapter(
+    pool_maxsize=search.app.config["SEARCH_INDEX_WORKERS"]
+))
+
+# Shards built from SEARCH_INDEX_SEGMENT_API_URLS and the thread checking
+# their health
+SHARDS = {"urls_config": None, "shards": [], "health_thread": None}
+SHARDS_LOCK = threading.Lock()
+
+# Fields of a hit the search API can return
+SEARCH_API_FIELDS = ("docid", "score", "url", "title", "summary")
+
+# Largest number of parameters in one SQLite statement on old versions
+SQLITE_MAX_VARIABLES = 999
+
+# Metadata of recently shown documents
+DOC_CACHE = search.cache.DocumentCache(
+    search.app.config["SEARCH_DOC_CACHE_BYTES"]
+)
+
+# Recently rendered result pages
+PAGE_CACHE = search.cache.PageCache(
+    search.app.config["SEARCH_PAGE_CACHE_BYTES"],
+    search.app.config["SEARCH_PAGE_CACHE_SECONDS"],
+)
 
 
 @search.app.route('/', methods=['GET'])
 def get_search():
-    """Display search results based on the query."""
+    """Display search results based on the query.
+
+    The optional 'p' argument selects the page of results, starting at 0.
+    Pages after SEARCH_MAX_PAGE show the last one.  Complete pages are served
+    from PAGE_CACHE until they expire, an index server reports a new index
+    version or the database file changes.  Cached pages carry an ETag, so
+    conditional requests for an unchanged page are answered with 304.
+    """
     query = request.args.get('q', type=str)
     weight = request.args.get('w', default=0.5, type=float)
-    connection = search.model.get_db()
+    page = min(max(request.args.get('p', default=0, type=int), 0),
+               search.app.config["SEARCH_MAX_PAGE"])
+    if not query:
+        return render_search(query, weight, page)[0]
+    query = " ".join(query.split())
+    key = (query, weight, page, search.app.config["SEARCH_PAGE_SIZE"])
+    version = (get_index_version(), search.model.database_version())
+    cached_page = PAGE_CACHE.get(version, key)
+    if cached_page is None:
+        body, missing_segments = render_search(query, weight, page)
+        if missing_segments:
+            return body
+        cached_page = PAGE_CACHE.put(version, key, body.encode("utf-8"))
+    response = make_response(cached_page.body)
+    response.set_etag(cached_page.etag)
+    return response.make_conditional(request)
+
+
+def get_index_version():
+    """Return every replica with the index version it last reported."""
+    return tuple(shard.versions() for shard in get_shards())
+
+
+def render_search(query, weight, page):
+    """Render a result page, return it and the segments missing from it."""
+    page_size = search.app.config["SEARCH_PAGE_SIZE"]
     no_empty = None
     if not query:
         if query == '':
@@ -21,57 +96,327 @@ def get_search():
             query = ''
     else:
         no_empty = True
-    hit_urls = generate_urls(query, weight)
-    threads = []
-    for hit_url in hit_urls:
-        thread = threading.Thread(target=send_request_get, args=(hit_url,))
-        threads.append(thread)
-        thread.start()
-    for thread in threads:
-        thread.join()
-    conf_hit = search.app.config["HIT_CONTEXT_LIST"]
-    top_ten_docs_info = []
-    for rank, doc_dict in enumerate(heapq.merge(
-            *conf_hit, key=lambda x: (x["score"], -x["docid"]), reverse=True)):
-        if rank >= 10:
-            break
-        curr_doc = get_doc_info(doc_dict, connection)
-        top_ten_docs_info.append(curr_doc)
+    top_ten_hits, missing_segments = search_hits(
+        query, weight, page * page_size, page_size
+    )
+    top_ten_docs_info = get_docs_info(
+        [doc_dict["docid"] for doc_dict in top_ten_hits]
+    )
     search_context = {
         "top_ten_docs": top_ten_docs_info,
         "query": query,
         "no_empty": no_empty,
         "weight": weight if weight not in (0.0, 1.0)
-        else '0' if weight == 0.0 else '1'
+        else '0' if weight == 0.0 else '1',
+        "prev_page": page - 1 if page > 0 else None,
+        "next_page": page + 1
+        if len(top_ten_docs_info) == page_size
+        and page < search.app.config["SEARCH_MAX_PAGE"] else None,
+        "missing_segments": missing_segments,
+    }
+    return render_template("index.html", **search_context), missing_segments
+
+
+@search.app.route('/api/v1/search/', methods=['GET'], strict_slashes=False)
+def get_search_api():
+    """Return ranked hits with their url, title and summary as JSON.
+
+    Optional 'k' and 'offset' arguments return hits offset to offset + k of
+    the ranking, by default the first SEARCH_PAGE_SIZE.  They may be at most
+    SEARCH_API_MAX_K and SEARCH_API_MAX_OFFSET.  The optional 'fields'
+    argument is a comma-separated subset of SEARCH_API_FIELDS to return for
+    each hit.  Segments that did not answer in time are listed in
+    'missing_segments'.
+    """
+    query = " ".join(request.args.get("q", default='', type=str).split())
+    weight = request.args.get("w", default=0.5, type=float)
+    k = request.args.get(
+        "k", default=search.app.config["SEARCH_PAGE_SIZE"], type=int
+    )
+    offset = request.args.get("offset", default=0, type=int)
+    fields = request.args.get(
+        "fields", default=",".join(SEARCH_API_FIELDS), type=str
+    ).split(",")
+    if (not 0 <= k <= search.app.config["SEARCH_API_MAX_K"]
+            or not 0 <= offset <= search.app.config["SEARCH_API_MAX_OFFSET"]
+            or not set(fields) <= set(SEARCH_API_FIELDS)):
+        abort(400)
+    hits, missing_segments = [], []
+    if query and k:
+        hits, missing_segments = search_hits(query, weight, offset, k)
+    if set(fields) - {"docid", "score"}:
+        docs_info = get_docs_info([hit["docid"] for hit in hits])
+    else:
+        docs_info = [None] * len(hits)
+    results = []
+    for hit, doc_info in zip(hits, docs_info):
+        result = dict(hit, **(doc_info or {}))
+        results.append({field: result.get(field) for field in fields})
+    context = {"hits": results, "missing_segments": missing_segments}
+    return jsonify(**context)
+
+
+def search_hits(query, weight, offset, k):
+    """Return hits offset to offset + k of the merged ranking.
+
+    The segments missing from the ranking because they did not answer in
+    time are returned too.
+    """
+    # The hits offset to offset + k are among the best offset + k of some
+    # shard
+    url_postfix = generate_url_postfix(query, weight, offset + k)
+    # Hits of this search only, one list per index segment
+    hit_lists = fetch_hits(url_postfix)
+    missing_segments = [
+        position for position, hits in enumerate(hit_lists) if hits is None
+    ]
+    hit_lists = [hits or [] for hits in hit_lists]
+    hits = list(itertools.islice(heapq.merge(
+        *hit_lists, key=lambda x: (x["score"], -x["docid"]), reverse=True
+    ), offset, offset + k))
+    return hits, missing_segments
+
+
+@search.app.route('/api/v1/stats/', methods=['GET'])
+def get_stats():
+    """Return document and page cache counters."""
+    context = {
+        "doc_cache": DOC_CACHE.stats(),
+        "page_cache": PAGE_CACHE.stats(),
     }
-    search.app.config["HIT_CONTEXT_LIST"].clear()
-    return render_template("index.html", **search_context)
+    return jsonify(**context)
+
 
+def generate_url_postfix(query, weight, num_hits):
+    """Generate the query string passed to the index servers.
 
-def generate_urls(query, weight):
-    """Generate the url used to be passed to the index server."""
+    Each index server is asked for its best num_hits hits only.
+    """
     queries = query.split()
     final_query = '+'.join(queries)
     url_postfix = f"?q={final_query}&w={weight}" if weight \
         else f"?q={final_query}"
-    search_api_urls = search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"]
-    url_list = [(url_prefix + url_postfix) for url_prefix in search_api_urls]
-    return url_list
+    url_postfix += f"&k={num_hits}"
+    return url_postfix
 
 
-def send_request_get(hit_url):
-    """Send the hit url to the index server, and get top 10 of each server."""
-    hit_context = requests.get(hit_url)
-    hit_context_json = hit_context.json()
-    top_ten_hit_list = hit_context_json["hits"][0:10]
-    search.app.config["HIT_CONTEXT_LIST"].append(top_ten_hit_list)
+def get_shards():
+    """Return the shards configured in SEARCH_INDEX_SEGMENT_API_URLS.
 
+    The shards are rebuilt when the setting changes.  The first call starts
+    the background health checks.
+    """
+    urls_config = search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"]
+    with SHARDS_LOCK:
+        if SHARDS["urls_config"] != urls_config:
+            SHARDS["urls_config"] = copy.deepcopy(urls_config)
+            SHARDS["shards"] = search.shards.build_shards(
+                urls_config, search.app.config["SEARCH_REPLICA_MAX_FAILURES"]
+            )
+        interval = search.app.config["SEARCH_HEALTH_CHECK_SECONDS"]
+        if SHARDS["health_thread"] is None and interval:
+            SHARDS["health_thread"] = threading.Thread(
+                target=check_health_forever, args=(interval,),
+                name="index-health", daemon=True,
+            )
+            SHARDS["health_thread"].start()
+        return SHARDS["shards"]
 
-def get_doc_info(hit_result, connection):
-    """Get doc_url, doc_title and doc_summary given the hit result (doc_id)."""
-    doc_result = connection.execute(
-        "SELECT url, title, summary FROM Documents WHERE docid = ?",
-        (hit_result["docid"],)
-    )
-    curr_doc = doc_result.fetchone()
-    return curr_doc
+
+def check_health_forever(interval):
+    """Check every replica each interval seconds, ejecting unready ones."""
+    while True:
+        time.sleep(interval)
+        for shard in get_shards():
+            for replica in shard.replicas:
+                shard.set_health(replica, is_ready(shard, replica))
+
+
+def is_ready(shard, replica):
+    """Return True if the replica reports that its index is loaded.
+
+    The index version it reports is recorded too.
+    """
+    try:
+        response = INDEX_SESSION.get(
+            replica.ready_url,
+            timeout=search.app.config["SEARCH_INDEX_TIMEOUT"],
+        )
+    except requests.RequestException:
+        return False
+    if "X-Index-Version" in response.headers:
+        shard.set_version(replica, response.headers["X-Index-Version"])
+    return response.status_code == 200
+
+
+def fetch_hits(url_postfix):
+    """Send the query to every shard, return a list of hits per shard.
+
+    A shard that has not answered within its SEARCH_HEDGE_PERCENTILE latency
+    is sent a hedged request on another replica, and a failed request is
+    retried on another replica, up to SEARCH_INDEX_ATTEMPTS requests per
+    shard.  The first answer wins.  Shards with no answer by the
+    SEARCH_DEADLINE_SECONDS deadline get None; their requests finish in the
+    background.
+    """
+    shards = get_shards()
+    start = time.monotonic()
+    deadline = start + search.app.config["SEARCH_DEADLINE_SECONDS"]
+    hedge_times = get_hedge_times(shards, start)
+    hit_lists = [None] * len(shards)
+    tried = [[] for _ in shards]
+    # Requests in flight and the position of their shard
+    pending = {}
+
+    def send(position):
+        """Send the query to a replica of the shard not tried yet."""
+        if len(tried[position]) >= search.app.config["SEARCH_INDEX_ATTEMPTS"]:
+            return
+        replica = shards[position].choose(exclude=tried[position])
+        if replica is None:
+            return
+        tried[position].append(replica)
+        future = INDEX_EXECUTOR.submit(
+            send_request_get, shards[position], replica, url_postfix
+        )
+        pending[future] = position
+
+    for position in range(len(shards)):
+        send(position)
+    while pending and time.monotonic() < deadline:
+        for position in set(pending.values()):
+            if hedge_times[position] <= time.monotonic():
+                hedge_times[position] = math.inf
+                send(position)
+        wake = min([deadline] + [
+            hedge_times[position] for position in pending.values()
+        ])
+        done = concurrent.futures.wait(
+            pending, timeout=max(wake - time.monotonic(), 0),
+            return_when=concurrent.futures.FIRST_COMPLETED,
+        ).done
+        for future in done:
+            # None if another request of the shard answered in this wait
+            position = pending.pop(future, None)
+            if position is None:
+                continue
+            hits = future.result()
+            if hits is None:
+                if position not in pending.values():
+                    send(position)
+                continue
+            hit_lists[position] = hits
+            # The other requests of the shard are no longer waited for
+            for other in [other for other, other_position in pending.items()
+                          if other_position == position]:
+                del pending[other]
+    return hit_lists
+
+
+def get_hedge_times(shards, start):
+    """Return when each shard's request is hedged if it has not answered."""
+    hedge_times = []
+    for shard in shards:
+        delay = shard.hedge_delay(search.app.config["SEARCH_HEDGE_PERCENTILE"])
+        hedge_times.append(math.inf if delay is None else start + delay)
+    return hedge_times
+
+
+def send_request_get(shard, replica, url_postfix):
+    """Send the query to a replica of the shard, return its hits.
+
+    Return None if the replica fails or does not answer within the timeout,
+    which counts against it.
+    """
+    start = time.monotonic()
+    try:
+        hit_context = INDEX_SESSION.get(
+            replica.hits_url + url_postfix,
+            timeout=search.app.config["SEARCH_INDEX_TIMEOUT"],
+        )
+        hit_context.raise_for_status()
+        hits = hit_context.json()["hits"]
+    except (requests.RequestException, ValueError, KeyError) as err:
+        shard.finish(replica, False, time.monotonic() - start)
+        search.app.logger.warning("Index server request failed: %s", err)
+        return None
+    shard.finish(replica, True, time.monotonic() - start)
+    if "X-Index-Version" in hit_context.headers:
+        shard.set_version(replica, hit_context.headers["X-Index-Version"])
+    return hits
+
+
+def get_docs_info(doc_ids):
+    """Get url, title and summary of each doc_id, in the order given.
+
+    Documents are looked up in DOC_CACHE first, and only the missing ones
+    are fetched from the database.  The cache is dropped when the database
+    file changes.  A doc_id missing from the database gives None.
+    """
+    db_version = search.model.database_version()
+    docs_info = DOC_CACHE.get_many(db_version, doc_ids)
+    missing_doc_ids = [
+        doc_id for doc_id in doc_ids if doc_id not in docs_info
+    ]
+    if missing_doc_ids:
+        fetched_docs = fetch_docs(missing_doc_ids, search.model.get_db())
+        DOC_CACHE.put_many(db_version, fetched_docs)
+        docs_info.update(fetched_docs)
+    return [docs_info.get(doc_id) for doc_id in doc_ids]
+
+
+def fetch_docs(doc_ids, connection):
+    """Return a dict mapping each doc_id found in the database to its info.
+
+    All documents are fetched with one query per SQLITE_MAX_VARIABLES doc
+    ids.
+    """
+    docs_info = {}
+    for start in range(0, len(doc_ids), SQLITE_MAX_VARIABLES):
+        chunk = doc_ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        doc_result = connection.execute(
+            "SELECT docid, url, title, summary FROM Documents "
+            f"WHERE docid IN ({placeholders})",
+            chunk
+        )
+        for curr_doc in doc_result:
+            docs_info[curr_doc["docid"]] = {
+                "url": curr_doc["url"],
+                "title": curr_doc["title"],
+                "summary": curr_doc["summary"],
+            }
+    return docs_info
+
+
+def warm_doc_cache(pagerank_path, num_docs):
+    """Load the num_docs documents with the highest pagerank into DOC_CACHE.
+
+    pagerank_path is a pagerank.out file of "doc_id,score" lines.
+    """
+    with open(str(pagerank_path), 'r', encoding='utf-8') as pagerankfile:
+        pageranks = []
+        for line in pagerankfile:
+            doc_id, score = line.strip().split(",")
+            pageranks.append((float(score), int(doc_id)))
+    top_doc_ids = [
+        doc_id for _, doc_id in heapq.nlargest(num_docs, pageranks)
+    ]
+    db_version = search.model.database_version()
+    connection = search.model.connect_db()
+    try:
+        DOC_CACHE.put_many(db_version, fetch_docs(top_doc_ids, connection))
+    finally:
+        connection.close()
+
+
+@search.app.before_first_request
+def start_doc_cache_warmup():
+    """Warm up DOC_CACHE in the background if a pagerank file is set."""
+    pagerank_path = search.app.config["SEARCH_DOC_CACHE_WARMUP_PATH"]
+    if pagerank_path:
+        threading.Thread(
+            target=warm_doc_cache, name="doc-cache-warmup", daemon=True,
+            args=(pagerank_path,
+                  search.app.config["SEARCH_DOC_CACHE_WARMUP_DOCS"]),
+        ).start()
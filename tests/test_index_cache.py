@@ -0,0 +1,37 @@
+"""Index Server result cache tests."""
+import index.cache
+
+
+def test_cache_lru_eviction():
+    """Verify the least recently used entry is evicted at the memory cap."""
+    key_a = (("a",), 0.5, 10)
+    key_b = (("b",), 0.5, 10)
+    key_c = (("c",), 0.5, 10)
+    hits = [(1, 0.5), (2, 0.25)]
+    entry_size = index.cache.ResultCache.entry_size(key_a, hits)
+    result_cache = index.cache.ResultCache(2 * entry_size)
+
+    result_cache.put("v1", key_a, hits)
+    result_cache.put("v1", key_b, hits)
+    assert result_cache.get("v1", key_a) == hits
+    result_cache.put("v1", key_c, hits)
+    assert result_cache.get("v1", key_b) is None
+    assert result_cache.get("v1", key_a) == hits
+    assert result_cache.get("v1", key_c) == hits
+
+    stats = result_cache.stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_cache_version():
+    """Verify entries are dropped when the index version changes."""
+    key = (("a",), 0.5, None)
+    result_cache = index.cache.ResultCache(1024 * 1024)
+    result_cache.put("v1", key, [])
+    assert result_cache.get("v1", key) == []
+    assert result_cache.get("v2", key) is None
+    assert result_cache.stats()["entries"] == 0
@@ -0,0 +1,107 @@
+"""Query evaluation engine tests."""
+import array
+import random
+import index.engine
+import index.segment
+
+
+def make_postings(doc_ids, idf_k=1.0):
+    """Return TermPostings for doc_ids with tf = doc_id % 7 + 1."""
+    doc_ids = sorted(doc_ids)
+    tfs = array.array("I", [doc_id % 7 + 1 for doc_id in doc_ids])
+    norms = array.array("d", [doc_id / 2 for doc_id in doc_ids])
+    _, max_weights = index.segment.block_max_weights(
+        [idf_k], [0, len(doc_ids)], tfs, norms
+    )
+    return index.segment.TermPostings(
+        idf_k=idf_k,
+        doc_ids=array.array("I", doc_ids),
+        tfs=tfs,
+        norms=norms,
+        max_weights=max_weights,
+    )
+
+
+def test_gallop():
+    """Verify gallop finds the first doc id not less than the target."""
+    doc_ids = array.array("I", [2, 3, 5, 8, 13, 21, 34, 55, 89])
+    for target in range(100):
+        for low in range(len(doc_ids) + 1):
+            expected = max(low, sum(1 for d in doc_ids if d < target))
+            assert index.engine.gallop(doc_ids, target, low) == expected
+
+
+def test_intersect_matches_sets():
+    """Verify intersect agrees with a set intersection."""
+    rng = random.Random(485)
+    for _ in range(200):
+        term_postings = {
+            f"term{i}": make_postings(rng.sample(
+                range(1000), rng.choice([1, 5, 50, 500, 900])
+            ))
+            for i in range(rng.randint(1, 4))
+        }
+        candidates = index.engine.intersect(term_postings)
+        expected = sorted(set.intersection(*(
+            set(postings.doc_ids) for postings in term_postings.values()
+        )))
+        assert list(candidates.doc_ids) == expected
+        for term in term_postings:
+            assert list(candidates.tfs[term]) == \
+                [doc_id % 7 + 1 for doc_id in expected]
+        assert list(candidates.norms) == [doc_id / 2 for doc_id in expected]
+
+
+def test_intersect_blocks_skips():
+    """Verify intersect_blocks only intersects the blocks it keeps."""
+    rng = random.Random(481)
+    term_postings = {
+        "rare": make_postings(rng.sample(range(100000), 2000)),
+        "common": make_postings(rng.sample(range(100000), 60000)),
+    }
+    lead = term_postings["rare"].doc_ids
+    block_size = index.segment.BLOCK_SIZE
+    kept = []
+
+    def keep_block(lead_term, block, first_doc_id, last_doc_id):
+        """Keep every third block."""
+        assert lead_term == "rare"
+        assert first_doc_id == lead[block * block_size]
+        end = min((block + 1) * block_size, len(lead))
+        assert last_doc_id == lead[end - 1]
+        if block % 3 == 0:
+            kept.append((first_doc_id, last_doc_id))
+            return True
+        return False
+
+    doc_ids = [
+        doc_id
+        for candidates in index.engine.intersect_blocks(
+            term_postings, keep_block
+        )
+        for doc_id in candidates.doc_ids
+    ]
+    expected = [
+        doc_id for doc_id in index.engine.intersect(term_postings).doc_ids
+        if any(first <= doc_id <= last for first, last in kept)
+    ]
+    assert doc_ids == expected
+
+
+def test_max_weight_between():
+    """Verify block maxima bound the weight of every posting in a range."""
+    rng = random.Random(482)
+    postings = make_postings(rng.sample(range(10000), 1000), idf_k=0.7)
+    for _ in range(100):
+        first, last = sorted(rng.sample(range(10000), 2))
+        weights = [
+            index.segment.posting_weight(tf_ik, postings.idf_k, norm)
+            for doc_id, tf_ik, norm
+            in zip(postings.doc_ids, postings.tfs, postings.norms)
+            if first <= doc_id <= last
+        ]
+        bound = index.engine.max_weight_between(postings, first, last)
+        if weights:
+            assert bound >= max(weights)
+        else:
+            assert bound is None
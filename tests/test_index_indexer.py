@@ -0,0 +1,57 @@
+"""Single-machine indexer tests."""
+from pathlib import Path
+import utils
+from utils import TEST_DIR
+import index.indexer
+import index.segment
+
+
+STOPWORDS_PATH = "hadoop/inverted_index/stopwords.txt"
+
+
+def test_example_output(tmp_path):
+    """Verify the indexer writes the example output byte for byte."""
+    text_paths = index.indexer.build_index(
+        [Path("hadoop/inverted_index/example_input/input.csv")],
+        tmp_path, STOPWORDS_PATH, num_segments=3, processes=2,
+    )
+    assert len(text_paths) == 3
+    for segment_id, text_path in enumerate(text_paths):
+        expected_path = Path(
+            f"hadoop/inverted_index/example_output/part-{segment_id:05d}"
+        )
+        assert text_path.read_bytes() == expected_path.read_bytes()
+
+
+def test_matches_pipeline(tmp_path):
+    """Verify the indexer and the MapReduce pipeline agree on many files."""
+    input_dir = TEST_DIR/"testdata/test_pipeline14/input_multi"
+    tmpdir = utils.create_and_clean_pipeline_testdir(
+        "tmp", "test_index_indexer"
+    )
+    num_docs = sum(
+        len(path.read_text(encoding="utf-8").splitlines())
+        for path in index.indexer.input_files(input_dir)
+    )
+    Path(tmpdir/"total_document_count.txt").write_text(
+        str(num_docs), encoding="utf-8"
+    )
+    with utils.CD(tmpdir):
+        output_dir = utils.Pipeline(
+            input_dir=input_dir, output_dir="output",
+        ).get_output_dir()
+
+    text_paths = index.indexer.build_index(
+        index.indexer.input_files(input_dir), tmp_path, STOPWORDS_PATH,
+    )
+    for text_path in text_paths:
+        segment_id = int(text_path.stem.rpartition("_")[2])
+        expected_path = output_dir/f"part-{segment_id:05d}"
+        assert text_path.read_bytes() == expected_path.read_bytes()
+
+    # The binary format is built from the text segments
+    segment_path = text_paths[0].with_suffix(index.segment.SEGMENT_SUFFIX)
+    index.segment.write_segment(text_paths[0], segment_path)
+    segment = index.segment.Segment(segment_path)
+    assert len(segment) == len(text_paths[0].read_text().splitlines())
+    segment.close()
@@ -0,0 +1,83 @@
+"""Binary inverted index segment tests."""
+import shutil
+import pytest
+import utils
+import index.segment
+
+
+def test_segment_matches_text(tmp_path):
+    """Verify a binary segment holds the same postings as its text segment."""
+    text_path = tmp_path/"part-00000"
+    shutil.copy(
+        "hadoop/inverted_index/example_output/part-00000",
+        text_path,
+    )
+    segment_path = tmp_path/"part-00000.seg"
+    index.segment.write_segment(text_path, segment_path)
+    segment = index.segment.Segment(segment_path)
+
+    lines = text_path.read_text(encoding="utf-8").splitlines()
+    assert len(segment) == len(lines)
+    for line in lines:
+        term, idf_k, *postings = line.split()
+        assert term in segment
+        term_postings = segment[term]
+        assert term_postings.idf_k == float(idf_k)
+        expected = sorted(
+            (int(doc_id), int(tf_ik), float(norm))
+            for doc_id, tf_ik, norm in utils.threesome(postings)
+        )
+        actual = list(zip(
+            term_postings.doc_ids, term_postings.tfs, term_postings.norms
+        ))
+        assert actual == expected
+
+    # Postings are views into the mapped file and must be dropped before close
+    del term_postings
+    assert "aaaaaaa" not in segment
+    with pytest.raises(KeyError):
+        segment["aaaaaaa"]  # pylint: disable=pointless-statement
+    segment.close()
+
+
+def test_load_segment_rebuilds_stale(tmp_path):
+    """Verify load_segment builds the binary segment next to the text one."""
+    text_path = tmp_path/"inverted_index_0.txt"
+    text_path.write_text(
+        "cat 0.5 2 1 0.25 10 3 2.5\n"
+        "dog 0.0 1 2 1.0\n",
+        encoding="utf-8",
+    )
+    segment = index.segment.load_segment(text_path)
+    assert (tmp_path/"inverted_index_0.seg").exists()
+    assert list(segment) == ["cat", "dog"]
+    assert list(segment["cat"].doc_ids) == [2, 10]
+    assert list(segment["cat"].tfs) == [1, 3]
+    segment.close()
+
+
+def test_concurrent_writes(tmp_path):
+    """Verify writers of the same segment do not share a temporary file."""
+    text_path = tmp_path/"inverted_index_0.txt"
+    shutil.copy(
+        "hadoop/inverted_index/example_output/part-00000",
+        text_path,
+    )
+    segment_path = tmp_path/"inverted_index_0.seg"
+
+    # Another writer builds the segment while this one is writing it
+    with index.segment.replace_atomically(segment_path, 'wb') as segfile:
+        index.segment.write_segment(text_path, segment_path)
+        segfile.write(segment_path.read_bytes())
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        ["inverted_index_0.seg", "inverted_index_0.txt"]
+    segment = index.segment.Segment(segment_path)
+    assert len(segment) == len(text_path.read_text().splitlines())
+    segment.close()
+
+    # A failed write leaves the segment alone
+    with pytest.raises(ValueError):
+        with index.segment.replace_atomically(segment_path, 'wb') as segfile:
+            raise ValueError("build failed")
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        ["inverted_index_0.seg", "inverted_index_0.txt"]
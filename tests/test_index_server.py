@@ -0,0 +1,307 @@
+"""Index Server REST API tests."""
+import shutil
+import threading
+import time
+import utils
+import index
+
+
+def test_top_k(index_client):
+    """Verify 'k' and 'offset' return a window of the full ranking.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    response = index_client.get("/api/v1/hits/?q=little+sebastian&w=0")
+    assert response.status_code == 200
+    hits_all = response.get_json()["hits"]
+    assert len(hits_all) > 4
+
+    for k, offset in [(3, 0), (2, 2), (100, 0), (3, len(hits_all) - 1)]:
+        response = index_client.get(
+            f"/api/v1/hits/?q=little+sebastian&w=0&k={k}&offset={offset}"
+        )
+        assert response.status_code == 200
+        utils.assert_compare_hits(
+            response.get_json()["hits"], hits_all[offset:offset + k]
+        )
+
+    response = index_client.get("/api/v1/hits/?q=little+sebastian&k=0")
+    assert response.status_code == 200
+    assert response.get_json() == {"hits": []}
+
+
+def test_top_k_invalid(index_client):
+    """Verify negative 'k' or 'offset' are rejected.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    response = index_client.get("/api/v1/hits/?q=little&k=-1")
+    assert response.status_code == 400
+    response = index_client.get("/api/v1/hits/?q=little&offset=-1")
+    assert response.status_code == 400
+
+
+def test_result_cache(index_client):
+    """Verify repeated queries are answered from the result cache.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    response = index_client.get("/api/v1/hits/?q=little+sebastian&k=5")
+    assert response.status_code == 200
+    hits_first = response.get_json()["hits"]
+    stats_first = index_client.get("/api/v1/stats/").get_json()
+
+    response = index_client.get("/api/v1/hits/?q=LITTLE+Sebastian&k=5")
+    assert response.status_code == 200
+    utils.assert_compare_hits(response.get_json()["hits"], hits_first)
+    stats_second = index_client.get("/api/v1/stats/").get_json()
+    assert stats_second["result_cache"]["hits"] == \
+        stats_first["result_cache"]["hits"] + 1
+    assert stats_second["result_cache"]["misses"] == \
+        stats_first["result_cache"]["misses"]
+
+
+def test_multiple_segments(index_client):
+    """Verify one server merges the rankings of several segments.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    # Load segments 0 and 1 into the server
+    assert index_client.get("/api/v1/").status_code == 200
+    index.app.config["INDEX_PATH"] = \
+        "inverted_index_0.txt,inverted_index_1.txt"
+    index.api.main.startup()
+
+    hits_segments = []
+    for position in range(2):
+        response = index_client.get(
+            "/api/v1/hits/?q=little+sebastian&w=0.3",
+            environ_overrides={"index.segments": (position,)},
+        )
+        assert response.status_code == 200
+        hits_segments.append(response.get_json()["hits"])
+    hits_expected = sorted(
+        hits_segments[0] + hits_segments[1],
+        key=lambda hit: (-hit["score"], hit["docid"]),
+    )
+    assert hits_segments[0] and hits_segments[1]
+
+    response = index_client.get("/api/v1/hits/?q=little+sebastian&w=0.3")
+    assert response.status_code == 200
+    utils.assert_compare_hits(response.get_json()["hits"], hits_expected)
+
+    response = index_client.get("/api/v1/hits/?q=little+sebastian&w=0.3&k=4")
+    assert response.status_code == 200
+    utils.assert_compare_hits(response.get_json()["hits"], hits_expected[:4])
+
+
+def test_ready(index_client):
+    """Verify the index loads in the background and reports when ready.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    # Importing the package with INDEX_PATH set starts loading the index
+    assert index.app.config["INDEX_LOADER"] is not None
+    response = index_client.get("/api/v1/ready")
+    assert response.status_code in (200, 503)
+    index.app.config["INDEX_LOADER"].join()
+
+    response = index_client.get("/api/v1/ready")
+    assert response.status_code == 200
+    status = response.get_json()
+    assert status["state"] == "ready"
+    assert status["load_seconds"] >= 0
+    assert status["num_terms"] == len(
+        index.app.config["INDEX"].segments[0].segment
+    )
+    assert status["num_postings"] > status["num_terms"]
+
+
+def test_ready_failed(index_client):
+    """Verify a failed load is reported and requests get 503.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    # Load again from scratch, as a server with a bad INDEX_PATH does
+    index.app.config["INDEX_LOADER"].join()
+    index.app.config.pop("INDEX")
+    index.app.config.pop("INDEX_STATUS")
+    index.app.config["INDEX_LOADER"] = None
+    index.app.config["INDEX_PATH"] = "missing.txt"
+    index.api.start_loading().join()
+
+    response = index_client.get("/api/v1/ready/")
+    assert response.status_code == 503
+    assert response.get_json()["state"] == "failed"
+    response = index_client.get("/api/v1/hits/?q=little")
+    assert response.status_code == 503
+
+
+def test_warm_up(index_client, tmp_path):
+    """Verify warm-up queries fill the result cache.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    warmup_path = tmp_path/"warmup.txt"
+    warmup_path.write_text("q=little+sebastian\n\nq=world&w=0.3\n",
+                           encoding="utf-8")
+    index.app.config["INDEX_LOADER"].join()
+    index.app.config["INDEX_WARMUP_PATH"] = str(warmup_path)
+    index.api.main.startup()
+    assert index.app.config["INDEX_STATUS"]["warmup_queries"] == 2
+
+    response = index_client.get("/api/v1/hits/?q=world&w=0.3")
+    assert response.status_code == 200
+    stats = index_client.get("/api/v1/stats/").get_json()["result_cache"]
+    assert stats["misses"] == 2
+    assert stats["hits"] == 1
+
+
+def copy_version(version_dir):
+    """Copy the package's index files and segment 0 to version_dir."""
+    package_dir = index.api.main.PACKAGE_DIR
+    (version_dir/"inverted_index").mkdir(parents=True)
+    shutil.copy(package_dir/"stopwords.txt", version_dir)
+    shutil.copy(package_dir/"pagerank.out", version_dir)
+    shutil.copy(
+        package_dir/"inverted_index"/"inverted_index_0.txt",
+        version_dir/"inverted_index",
+    )
+
+
+def test_hot_swap(index_client, tmp_path):
+    """Verify a new index version is served without dropping requests.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    # Two versions of segment 0.  Version v2 has every pagerank doubled.
+    package_dir = index.api.main.PACKAGE_DIR
+    copy_version(tmp_path/"v1")
+    copy_version(tmp_path/"v2")
+    with open(tmp_path/"v2"/"pagerank.out", "w", encoding="utf-8") as outfile:
+        for line in (package_dir/"pagerank.out").read_text().splitlines():
+            doc_id, score = line.split(",")
+            outfile.write(f"{doc_id},{2 * float(score)}\n")
+    index.app.config["INDEX_LOADER"].join()
+    index.app.config["INDEX_VERSIONS_DIR"] = str(tmp_path)
+    index.api.main.startup(tmp_path/"v1")
+
+    response = index_client.get("/api/v1/hits/?q=little+sebastian&w=1")
+    hits_v1 = response.get_json()["hits"]
+    version_v1 = response.headers["X-Index-Version"]
+    assert version_v1.startswith("v1:")
+
+    # A request still running on v1 keeps it mapped during the swap
+    state_v1 = index.api.main.acquire_index()
+    response = index_client.post("/api/v1/reload/?version=v2")
+    assert response.status_code == 202
+    for _ in range(100):
+        if index.app.config["INDEX_STATUS"]["index_dir"].endswith("v2"):
+            break
+        time.sleep(0.1)
+    assert index_client.get("/api/v1/ready").get_json()["state"] == "ready"
+
+    response = index_client.get("/api/v1/hits/?q=little+sebastian&w=1")
+    assert response.headers["X-Index-Version"].startswith("v2:")
+    hits_v2 = response.get_json()["hits"]
+    assert [hit["docid"] for hit in hits_v2] == \
+        [hit["docid"] for hit in hits_v1]
+    for hit_v1, hit_v2 in zip(hits_v1, hits_v2):
+        assert hit_v2["score"] == 2 * hit_v1["score"]
+
+    assert "little" in state_v1.segments[0].segment
+    state_v1.release()
+    assert state_v1.in_flight() == 0
+    assert not state_v1.acquire()
+
+    response = index_client.post("/api/v1/reload/?version=v3")
+    assert response.status_code == 404
+    response = index_client.post("/api/v1/reload/?version=..")
+    assert response.status_code == 400
+
+
+def test_reload_conflict(index_client, mocker):
+    """Verify a reload is refused while another one is running.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    index.api.start_loading().join()
+    assert index_client.get("/api/v1/ready").status_code == 200
+
+    # Hold the first reload until both requests have been answered
+    release = threading.Event()
+    load_and_serve = mocker.patch.object(
+        index.api.main, "load_and_serve",
+        side_effect=lambda index_dir: release.wait(5),
+    )
+    assert index_client.post("/api/v1/reload/").status_code == 202
+    assert index_client.post("/api/v1/reload/").status_code == 409
+    release.set()
+    for _ in range(100):
+        if not index.api.main.RELOAD_LOCK.locked():
+            break
+        time.sleep(0.1)
+    assert not index.api.main.RELOAD_LOCK.locked()
+    assert load_and_serve.call_count == 1
+
+
+def test_watch_versions(index_client, tmp_path, mocker):
+    """Verify the version watcher survives errors and loads new versions.
+
+    'index_client' is a fixture fuction that provides a Flask test server
+    interface. It is implemented in conftest.py and reused by many tests.
+    Docs: https://docs.pytest.org/en/latest/fixture.html
+    """
+    copy_version(tmp_path/"v1")
+    index.app.config["INDEX_VERSIONS_DIR"] = str(tmp_path)
+
+    # Polls fail with a KeyError until an index has been loaded
+    index.app.config["INDEX_LOADER"].join()
+    index.app.config.pop("INDEX_STATUS")
+    startup = mocker.spy(index.api.main, "startup")
+    stop = threading.Event()
+    watcher = index.api.main.watch_versions(0.05, stop)
+    try:
+        time.sleep(0.2)
+        assert watcher.is_alive()
+
+        index.api.main.startup(tmp_path/"v1")
+        # Publish v2 by renaming a complete directory into place
+        copy_version(tmp_path/".v2")
+        (tmp_path/".v2").rename(tmp_path/"v2")
+        for _ in range(100):
+            if index.app.config["INDEX_STATUS"]["index_dir"].endswith("v2"):
+                break
+            time.sleep(0.1)
+        response = index_client.get("/api/v1/hits/?q=little+sebastian&w=1")
+        assert response.headers["X-Index-Version"].startswith("v2:")
+
+        # A version that fails to load is tried once, not at every poll
+        (tmp_path/"v3").mkdir()
+        time.sleep(0.5)
+        attempts = [call.args[0] for call in startup.call_args_list]
+        assert attempts.count(tmp_path/"v3") == 1
+        status = index.app.config["INDEX_STATUS"]
+        assert status["index_dir"].endswith("v2")
+        assert "v3" in status["reload_error"]
+    finally:
+        stop.set()
+        watcher.join()
@@ -0,0 +1,116 @@
+"""Inverted Index MapReduce pipeline and fake Hadoop tests."""
+import collections
+import os
+import shutil
+import subprocess
+from pathlib import Path
+import utils
+
+
+def test_combiner():
+    """Verify a combiner shrinks map output without changing the result."""
+    tmpdir = utils.create_and_clean_testdir("tmp", "test_combiner")
+    for filename in ("map.py", "reduce.py"):
+        shutil.copy(Path("hadoop/word_count")/filename, tmpdir)
+
+    with utils.CD(tmpdir):
+        utils.hadoop(
+            input_dir=Path("../../hadoop/word_count/input"),
+            output_dir="output",
+            map_exe="./map.py",
+            reduce_exe="./reduce.py",
+        )
+        utils.hadoop(
+            input_dir=Path("../../hadoop/word_count/input"),
+            output_dir="output_combined",
+            map_exe="./map.py",
+            reduce_exe="./reduce.py",
+            combine_exe="./reduce.py",
+        )
+
+    def read_lines(pattern):
+        return sorted(
+            line for path in tmpdir.glob(pattern)
+            for line in path.read_text(encoding="utf-8").splitlines()
+        )
+
+    assert read_lines("output_combined/part-*") == \
+        read_lines("output/part-*")
+    map_lines = read_lines("output/hadooptmp/mapper-output/*")
+    combined_map_lines = \
+        read_lines("output_combined/hadooptmp/mapper-output/*")
+    assert len(combined_map_lines) < len(map_lines)
+    assert len(combined_map_lines) == len(set(
+        (path, line.partition("\t")[0])
+        for path in tmpdir.glob("output_combined/hadooptmp/mapper-output/*")
+        for line in path.read_text(encoding="utf-8").splitlines()
+    ))
+
+
+def test_map1_term_frequencies():
+    """Verify map1 emits each term once per document with its frequency."""
+    tmpdir = utils.create_and_clean_pipeline_testdir("tmp", "test_map1")
+    input_path = Path("hadoop/inverted_index/example_input/input.csv")
+    with open(input_path, encoding="utf-8") as infile:
+        output = subprocess.run(
+            ["./map1.py"], cwd=tmpdir, stdin=infile, check=True,
+            capture_output=True, text=True,
+        ).stdout
+    records = [line.split("\t") for line in output.splitlines()]
+    keys = [(term, doc_id) for term, doc_id, _ in records]
+    assert len(keys) == len(set(keys))
+
+    term_freqs = collections.Counter()
+    for term, doc_id, tf_ik in records:
+        term_freqs[term, doc_id] += int(tf_ik)
+    # "document" appears in both the title and the body of every document
+    assert term_freqs["document", "1"] == 2
+
+
+def test_reduce2_streams():
+    """Verify reduce2 outputs a document before reading the next one."""
+    tmpdir = utils.create_and_clean_pipeline_testdir("tmp", "test_reduce2")
+    with subprocess.Popen(
+            ["./reduce2.py"], cwd=tmpdir, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, text=True,
+            env={"PYTHONUNBUFFERED": "1", "PATH": os.environ["PATH"]},
+    ) as reduce_proc:
+        reduce_proc.stdin.write("1\tflag\t1\t3.0\n1\tworld\t2\t2.0\n")
+        # The start of the next group ends the first one
+        reduce_proc.stdin.write("2\tdogs\t1\t1.0\n")
+        reduce_proc.stdin.flush()
+
+        assert reduce_proc.stdout.readline() == \
+            "1\t25.0\tflag\t1\t3.0\tworld\t2\t2.0\n"
+        reduce_proc.stdin.close()
+        assert reduce_proc.stdout.readline() == "2\t1.0\tdogs\t1\t1.0\n"
+
+
+def test_reduce3_external_sort():
+    """Verify reduce3 merges spilled runs when its input is not sorted."""
+    tmpdir = utils.create_and_clean_pipeline_testdir("tmp", "test_reduce3")
+    expected_path = Path("hadoop/inverted_index/example_output/part-00000")
+    expected = expected_path.read_text(encoding="utf-8")
+    map_lines = []
+    for line in expected.splitlines():
+        term, idf_k, *postings = line.split()
+        for doc_id, tf_ik, norm in utils.threesome(postings):
+            map_lines.append(
+                f"0\t{term}\t{doc_id}\t{tf_ik}\t{norm}\t{idf_k}\n"
+            )
+    unsorted_input = "".join(reversed(map_lines))
+
+    def run_reduce3(reduce_input, **environ):
+        return subprocess.run(
+            ["./reduce3.py"], cwd=tmpdir, input=reduce_input, text=True,
+            capture_output=True, check=False,
+            env={"PATH": os.environ["PATH"], **environ},
+        )
+
+    assert run_reduce3("".join(sorted(map_lines))).stdout == expected
+    assert run_reduce3(unsorted_input).returncode != 0
+    reduce_proc = run_reduce3(
+        unsorted_input, REDUCE3_EXTERNAL_SORT="1", REDUCE3_RUN_LINES="4"
+    )
+    assert reduce_proc.returncode == 0
+    assert reduce_proc.stdout == expected
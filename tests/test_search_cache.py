@@ -0,0 +1,57 @@
+"""Search Server document cache tests."""
+import search.cache
+
+
+def test_doc_cache_lru_eviction():
+    """Verify the least recently used document is evicted at the cap."""
+    doc = {"url": "https://example.com", "title": "Example", "summary": ""}
+    doc_cache = search.cache.DocumentCache(0)
+    doc_cache.max_bytes = 2 * doc_cache.entry_size(1, doc)
+
+    doc_cache.put_many("v1", {1: doc, 2: doc})
+    assert doc_cache.get_many("v1", [1]) == {1: doc}
+    doc_cache.put_many("v1", {3: doc})
+    assert doc_cache.get_many("v1", [1, 2, 3]) == {1: doc, 3: doc}
+
+    stats = doc_cache.stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.75
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= stats["max_bytes"]
+
+    # A new database version drops every document
+    assert not doc_cache.get_many("v2", [1, 3])
+    assert doc_cache.stats()["entries"] == 0
+
+
+def test_page_cache():
+    """Verify pages expire, are evicted at the cap and dropped by version."""
+    key = ("hello world", 0.5, 0)
+    body = b"<html></html>"
+    page_cache = search.cache.PageCache(0, ttl=60)
+    page_cache.max_bytes = 2 * page_cache.entry_size(
+        key, search.cache.Page(body, "", 0)
+    )
+
+    page = page_cache.put("v1", key, body)
+    assert page_cache.get("v1", key) == page
+    assert page.etag == page_cache.put("v1", ("other", 0.5, 0), body).etag
+    page_cache.put("v1", ("third", 0.5, 0), body)
+    assert page_cache.get("v1", key) is None
+    assert page_cache.stats()["evictions"] == 1
+
+    # A new index version drops every page
+    page_cache.put("v1", key, body)
+    assert page_cache.get("v2", key) is None
+    assert page_cache.stats()["entries"] == 0
+
+    # Expired pages are not served
+    page_cache.ttl = 0
+    page_cache.put("v2", key, body)
+    assert page_cache.get("v2", key) is None
+    stats = page_cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+    assert stats["bytes"] == 0
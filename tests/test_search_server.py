@@ -0,0 +1,400 @@
+"""Search Server tests."""
+import concurrent.futures
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import time
+import bs4
+import pytest
+import search
+
+
+QUERIES = [
+    "hello world",
+    "dogs",
+    "pies",
+    "little sebastian",
+    "world flags",
+    "every",
+    "flags",
+    "hello",
+]
+
+
+def unresponsive_url():
+    """Return a hits URL and its socket, which accepts but never answers."""
+    sock = socket.socket()
+    sock.bind(("localhost", 0))
+    sock.listen(64)
+    return f"http://localhost:{sock.getsockname()[1]}/api/v1/hits/", sock
+
+
+def doc_titles(response):
+    """Return the document titles on a search result page."""
+    assert response.status_code == 200
+    soup = bs4.BeautifulSoup(response.data, "html.parser")
+    return [
+        re.sub(r"\s+", " ", x.text.strip())
+        for x in soup.find_all("div", {"class": "doc_title"})
+    ]
+
+
+def test_concurrent_searches(search_client):
+    """Verify concurrent searches do not see each other's hits.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    urls = [
+        f"/?q={query.replace(' ', '+')}&w={weight}"
+        for query in QUERIES for weight in ("0", "0.5")
+    ]
+    expected = {url: doc_titles(search_client.get(url)) for url in urls}
+    assert any(expected.values())
+
+    def search_titles(url):
+        with search.app.test_client() as client:
+            return doc_titles(client.get(url))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        urls_repeated = urls * 8
+        results = executor.map(search_titles, urls_repeated)
+        for url, titles in zip(urls_repeated, results):
+            assert titles == expected[url], url
+
+
+def test_db_pool(search_client):
+    """Verify database connections are read-only and reused.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    assert search_client.get("/?q=dogs").status_code == 200
+    with search.app.app_context():
+        connection = search.model.get_db()
+        with pytest.raises(sqlite3.OperationalError):
+            connection.execute("DELETE FROM Documents")
+    with search.app.app_context():
+        assert search.model.get_db() is connection
+
+    # Replacing the database file, as bin/indexdb reset does, closes the
+    # pooled connections and drops the cached documents
+    response = search_client.get("/api/v1/search/?q=dogs&k=1&fields=docid")
+    doc_id = response.get_json()["hits"][0]["docid"]
+    db_path = search.app.config["DATABASE_FILENAME"]
+    new_db_path = db_path.with_name("new.sqlite3")
+    shutil.copy(db_path, new_db_path)
+    with sqlite3.connect(str(new_db_path)) as new_db:
+        new_db.execute(
+            "UPDATE Documents SET title = 'Replaced' WHERE docid = ?",
+            (doc_id,)
+        )
+    new_db.close()
+    os.replace(new_db_path, db_path)
+    response = search_client.get(
+        "/api/v1/search/?q=dogs&k=1&fields=docid,title"
+    )
+    assert response.get_json()["hits"][0]["title"] == "Replaced"
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT 1")
+
+
+def test_doc_cache(search_client):
+    """Verify repeated result pages are rendered from the document cache.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    # Render the page again rather than serving it from the page cache
+    search.views.views.PAGE_CACHE.ttl = 0
+    try:
+        titles = doc_titles(search_client.get("/?q=dogs&w=0.22"))
+        assert titles
+        stats_first = search_client.get("/api/v1/stats/").get_json()
+        assert doc_titles(search_client.get("/?q=dogs&w=0.22")) == titles
+        stats_second = search_client.get("/api/v1/stats/").get_json()
+    finally:
+        search.views.views.PAGE_CACHE.ttl = \
+            search.app.config["SEARCH_PAGE_CACHE_SECONDS"]
+    stats_first = stats_first["doc_cache"]
+    stats_second = stats_second["doc_cache"]
+    assert stats_second["hits"] == stats_first["hits"] + len(titles)
+    assert stats_second["misses"] == stats_first["misses"]
+
+    # Warm-up loads the documents with the highest pagerank
+    search.views.views.warm_doc_cache("index/index/pagerank.out", 5)
+    with open("index/index/pagerank.out", encoding="utf-8") as pagerankfile:
+        top_doc_id = max(
+            (float(score), int(doc_id)) for doc_id, score
+            in (line.strip().split(",") for line in pagerankfile)
+        )[1]
+    assert top_doc_id in search.views.views.DOC_CACHE.get_many(
+        search.model.database_version(), [top_doc_id]
+    )
+
+
+def test_pages(search_client):
+    """Verify result pages continue the ranking of the first page.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    search.app.config["SEARCH_PAGE_SIZE"] = 30
+    try:
+        titles_all = doc_titles(search_client.get("/?q=world&w=0.3"))
+    finally:
+        search.app.config["SEARCH_PAGE_SIZE"] = 10
+    assert len(titles_all) == 30
+
+    for page in range(3):
+        response = search_client.get(f"/?q=world&w=0.3&p={page}")
+        assert doc_titles(response) == titles_all[page * 10:page * 10 + 10]
+        soup = bs4.BeautifulSoup(response.data, "html.parser")
+        links = [link.text for link in soup.find_all("a", "page_link")]
+        assert ("Previous" in links) == (page > 0)
+        assert "Next" in links
+
+    # Pages after the last one allowed show the last one, with no next page.
+    # The cached page 1 has a next page, so it is flushed.
+    search.app.config["SEARCH_MAX_PAGE"] = 1
+    with search.views.views.PAGE_CACHE.lock:
+        search.views.views.PAGE_CACHE.clear_version(None)
+    try:
+        response = search_client.get("/?q=world&w=0.3&p=1000000")
+    finally:
+        search.app.config["SEARCH_MAX_PAGE"] = 99
+    assert doc_titles(response) == titles_all[10:20]
+    soup = bs4.BeautifulSoup(response.data, "html.parser")
+    links = [link.text for link in soup.find_all("a", "page_link")]
+    assert "Next" not in links
+
+
+def test_replicas(search_client):
+    """Verify searches fail over from a dead replica, which is ejected.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    expected = {
+        query: doc_titles(search_client.get(f"/?q={query}"))
+        for query in QUERIES
+    }
+
+    api_urls = search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"]
+    dead_url = "http://localhost:1/api/v1/hits/"
+    search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"] = (
+        [[dead_url, api_urls[0]]] + api_urls[1:]
+    )
+    # Send every search to the index servers rather than the page cache
+    search.views.views.PAGE_CACHE.ttl = 0
+    try:
+        for _ in range(3):
+            for query in QUERIES:
+                titles = doc_titles(search_client.get(f"/?q={query}"))
+                assert titles == expected[query], query
+        dead = search.views.views.get_shards()[0].replicas[0]
+        assert dead.hits_url == dead_url
+        assert not dead.healthy
+    finally:
+        search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"] = api_urls
+        search.views.views.PAGE_CACHE.ttl = \
+            search.app.config["SEARCH_PAGE_CACHE_SECONDS"]
+
+
+def test_deadline(search_client):
+    """Verify a search shows partial results when a segment is too slow.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    response = search_client.get("/?q=world")
+    assert doc_titles(response)
+    assert b"partial_results" not in response.data
+
+    api_urls = search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"]
+    slow_url, sock = unresponsive_url()
+    search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"] = (
+        [slow_url] + api_urls[1:]
+    )
+    search.app.config["SEARCH_DEADLINE_SECONDS"] = 0.3
+    try:
+        start = time.monotonic()
+        response = search_client.get("/?q=world")
+        assert time.monotonic() - start < 2
+        assert doc_titles(response)
+        soup = bs4.BeautifulSoup(response.data, "html.parser")
+        marker = soup.find("div", "partial_results")
+        assert "segments 0 " in re.sub(r"\s+", " ", marker.text)
+    finally:
+        search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"] = api_urls
+        search.app.config["SEARCH_DEADLINE_SECONDS"] = 2.0
+        sock.close()
+
+
+def test_hedging(search_client):
+    """Verify a slow replica is hedged on another replica.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    expected = doc_titles(search_client.get("/?q=world"))
+
+    api_urls = search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"]
+    slow_url, sock = unresponsive_url()
+    search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"] = (
+        [[slow_url, api_urls[0]]] + api_urls[1:]
+    )
+    search.app.config["SEARCH_DEADLINE_SECONDS"] = 3.0
+    try:
+        # Give the shard a latency history, and send first requests to the
+        # slow replica by marking the other one unhealthy
+        shard = search.views.views.get_shards()[0]
+        for _ in range(search.shards.MIN_LATENCY_SAMPLES):
+            shard.finish(shard.choose(), True, 0.05)
+        shard.set_health(shard.replicas[1], False)
+
+        start = time.monotonic()
+        response = search_client.get("/?q=world")
+        assert time.monotonic() - start < 1
+        assert doc_titles(response) == expected
+        assert b"partial_results" not in response.data
+        assert shard.replicas[0].outstanding == 1
+    finally:
+        search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"] = api_urls
+        search.app.config["SEARCH_DEADLINE_SECONDS"] = 2.0
+        sock.close()
+
+
+def test_hedge_finishes_together(search_client, mocker):
+    """Verify a shard whose requests finish in the same wait is answered once.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Note: 'mocker' is a fixture function provided by the pytest-mock package.
+    Patches made with it are undone at the end of the test.
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    expected = doc_titles(search_client.get("/?q=world"))
+
+    # Hedge every shard at once on a second replica, and return from a wait
+    # only when every request in flight has finished
+    views = search.views.views
+    api_urls = search.app.config["SEARCH_INDEX_SEGMENT_API_URLS"]
+    mocker.patch.dict(search.app.config, {
+        "SEARCH_INDEX_SEGMENT_API_URLS": [
+            [api_url, api_url] for api_url in api_urls
+        ],
+    })
+    mocker.patch.object(
+        views, "get_hedge_times",
+        side_effect=lambda shards, start: [start] * len(shards),
+    )
+    wait = concurrent.futures.wait
+    mocker.patch.object(
+        concurrent.futures, "wait",
+        side_effect=lambda futures, timeout, return_when: wait(
+            futures, timeout
+        ),
+    )
+    mocker.patch.object(views.PAGE_CACHE, "ttl", 0)
+
+    response = search_client.get("/?q=world")
+    assert doc_titles(response) == expected
+    assert b"partial_results" not in response.data
+
+
+def test_page_cache(search_client):
+    """Verify result pages are cached, revalidated and flushed.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    # Pages are cached under the index versions the replicas reported before
+    # the search, so the first search only learns the versions
+    search_client.get("/?q=hello&w=0.3")
+    response = search_client.get("/?q=world&w=0.3")
+    stats = search.views.views.PAGE_CACHE.stats()
+    etag = response.headers["ETag"]
+
+    # The same query with other spacing is served from the cache
+    response = search_client.get("/?q=++world+&w=0.3")
+    assert response.headers["ETag"] == etag
+    assert search.views.views.PAGE_CACHE.stats()["hits"] == stats["hits"] + 1
+
+    response = search_client.get(
+        "/?q=world&w=0.3", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert not response.data
+
+    # A new index version on any replica flushes the cache
+    shard = search.views.views.get_shards()[0]
+    shard.set_version(shard.replicas[0], "new")
+    search_client.get("/?q=world&w=0.3")
+    stats = search.views.views.PAGE_CACHE.stats()
+    assert stats["entries"] == 1
+    assert stats["misses"] >= 2
+
+
+def test_search_api(search_client):
+    """Verify the JSON search API returns the hits of the result pages.
+
+    'search_client' is a fixture function that provides a Flask test server
+    interface
+
+    Fixtures are implemented in conftest.py and reused by many tests.  Docs:
+    https://docs.pytest.org/en/latest/fixture.html
+    """
+    titles = doc_titles(search_client.get("/?q=world&w=0.3&p=1"))
+    response = search_client.get("/api/v1/search/?q=world&w=0.3&offset=10")
+    assert response.status_code == 200
+    context = response.get_json()
+    assert context["missing_segments"] == []
+    assert [hit["title"] for hit in context["hits"]] == titles
+    assert set(context["hits"][0]) == set(search.views.views.SEARCH_API_FIELDS)
+    scores = [hit["score"] for hit in context["hits"]]
+    assert scores == sorted(scores, reverse=True)
+
+    response = search_client.get(
+        "/api/v1/search?q=world&w=0.3&k=3&offset=11&fields=docid,title"
+    )
+    hits = response.get_json()["hits"]
+    assert [hit["title"] for hit in hits] == titles[1:4]
+    assert all(set(hit) == {"docid", "title"} for hit in hits)
+
+    response = search_client.get("/api/v1/search/?q=&k=5")
+    assert response.get_json()["hits"] == []
+
+    for args in ("k=-1", "offset=-1", "k=1001", "offset=10001",
+                 "fields=docid,body"):
+        response = search_client.get(f"/api/v1/search/?q=world&{args}")
+        assert response.status_code == 400, args
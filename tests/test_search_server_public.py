@@ -3,7 +3,7 @@
 import pathlib
 import subprocess
 import re
-import threading
+import concurrent.futures
 import bs4
 import utils
 
@@ -21,7 +21,7 @@ def test_concurrency(search_client, mocker):
     Fixtures are implemented in conftest.py and reused by many tests.  Docs:
     https://docs.pytest.org/en/latest/fixture.html
     """
-    spy = mocker.spy(threading.Thread, "start")
+    spy = mocker.spy(concurrent.futures.ThreadPoolExecutor, "submit")
     response = search_client.get("/?q=hello+world")
     assert response.status_code == 200
     assert spy.call_count == 3
@@ -0,0 +1,72 @@
+"""Search Server shard and replica tests."""
+import search.shards
+
+
+def test_choose_least_outstanding():
+    """Verify the replica with fewer outstanding requests is chosen."""
+    shard = search.shards.Shard(["http://a/", "http://b/"], max_failures=3)
+    busy = shard.choose()
+    for _ in range(10):
+        replica = shard.choose()
+        assert replica is not busy
+        shard.finish(replica, succeeded=True, seconds=0.01)
+    assert busy.outstanding == 1
+
+
+def test_eject_after_failures():
+    """Verify a replica is ejected after failing max_failures requests."""
+    shard = search.shards.Shard(["http://a/", "http://b/"], max_failures=2)
+    failing, other = shard.replicas
+    for _ in range(2):
+        replica = shard.choose(exclude=[other])
+        shard.finish(replica, succeeded=False, seconds=1.0)
+    assert not failing.healthy
+    for _ in range(10):
+        replica = shard.choose()
+        assert replica is other
+        shard.finish(replica, succeeded=True, seconds=0.01)
+
+    # A health check brings the replica back
+    shard.set_health(failing, True)
+    assert failing.healthy
+    assert failing.failures == 0
+
+
+def test_all_ejected():
+    """Verify ejected replicas are still tried when no replica is healthy."""
+    shard = search.shards.Shard(["http://a/", "http://b/"], max_failures=1)
+    for replica in shard.replicas:
+        shard.set_health(replica, False)
+    first = shard.choose()
+    assert first is not None
+    second = shard.choose(exclude=[first])
+    assert second not in (None, first)
+    assert shard.choose(exclude=shard.replicas) is None
+
+    # A successful request marks the replica healthy again
+    shard.finish(first, succeeded=True, seconds=0.01)
+    assert first.healthy
+
+
+def test_build_shards():
+    """Verify shards are built from single URLs and lists of replicas."""
+    shards = search.shards.build_shards(
+        ["http://a:9000/api/v1/hits/",
+         ["http://b:9001/api/v1/hits/", "http://c:9001/api/v1/hits/"]],
+        max_failures=3,
+    )
+    assert [len(shard.replicas) for shard in shards] == [1, 2]
+    assert shards[1].replicas[1].ready_url == "http://c:9001/api/v1/ready/"
+
+
+def test_hedge_delay():
+    """Verify the hedge delay is a percentile of successful latencies."""
+    shard = search.shards.Shard(["http://a/", "http://b/"], max_failures=3)
+    for milliseconds in range(1, search.shards.MIN_LATENCY_SAMPLES):
+        shard.finish(shard.choose(), True, milliseconds / 1000)
+    assert shard.hedge_delay(95) is None
+
+    shard.finish(shard.choose(), False, 10.0)
+    shard.finish(shard.choose(), True, 0.02)
+    assert shard.hedge_delay(95) == 0.019
+    assert shard.hedge_delay(0) == 0.001
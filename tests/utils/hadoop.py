@@ -12,6 +12,9 @@ $ hadoop \
   -output $HADOOP_DIR/output \
   -mapper $EXEC_DIR/map.py \
   -reducer $EXEC_DIR/reduce.py
+
+An optional "-combiner $EXEC_DIR/combine.py" runs on the sorted output of
+each map task before the group stage, like a Hadoop Streaming combiner.
 """
 import argparse
 import collections
@@ -52,6 +55,7 @@ def main():
     required_args.add_argument('-output', dest='output', required=True)
     required_args.add_argument('-mapper', dest='mapper', required=True)
     required_args.add_argument('-reducer', dest='reducer', required=True)
+    optional_args.add_argument('-combiner', dest='combiner', default=None)
 
     args, dummy = parser.parse_known_args()
 
@@ -61,6 +65,7 @@ def main():
             output_dir=args.output,
             map_exe=args.mapper,
             reduce_exe=args.reducer,
+            combine_exe=args.combiner,
         )
     except subprocess.CalledProcessError as err:
         sys.exit(
@@ -70,9 +75,13 @@ def main():
         sys.exit(f"Error: {err}")
 
 
-def hadoop(input_dir, output_dir, map_exe, reduce_exe, enforce_keyspace=False):
+def hadoop(input_dir, output_dir, map_exe, reduce_exe, enforce_keyspace=False,
+           combine_exe=None):
     # pylint: disable-msg=too-many-arguments
-    """End Point to run a hadoop job."""
+    """End Point to run a hadoop job.
+
+    If combine_exe is given, it combines the sorted output of each map task.
+    """
     # Do not clobber existing output directory
     output_dir = Path(output_dir)
     if output_dir.exists():
@@ -103,6 +112,9 @@ def hadoop(input_dir, output_dir, map_exe, reduce_exe, enforce_keyspace=False):
     # Executable scripts must have valid shebangs
     check_shebang(map_exe)
     check_shebang(reduce_exe)
+    if combine_exe is not None:
+        combine_exe = pathlib.Path(combine_exe).resolve()
+        check_shebang(combine_exe)
 
     # Run the mapping stage
     print("Starting map stage")
@@ -114,6 +126,15 @@ def hadoop(input_dir, output_dir, map_exe, reduce_exe, enforce_keyspace=False):
         enforce_keyspace=enforce_keyspace,
     )
 
+    # Run the combining stage
+    if combine_exe is not None:
+        print("Starting combine stage")
+        combine_stage(
+            exe=combine_exe,
+            input_dir=map_output_dir,
+            num_map=num_map,
+        )
+
     # Run the grouping stage
     print("Starting group stage")
     num_reduce = group_stage(
@@ -242,6 +263,35 @@ def map_stage(exe, input_dir, output_dir, num_map, enforce_keyspace):
             check_num_keys(output_path)
 
 
+def combine_stage(exe, input_dir, num_map):
+    """Execute combiners, replacing the output of each map task.
+
+    Each map output file is sorted and piped through the combiner, so the
+    combiner sees its keys in groups like a reducer does.
+    """
+    for i in range(num_map):
+        map_output_path = input_dir/part_filename(i)
+        sorted_path = input_dir/(part_filename(i) + ".sorted")
+        print(f"+ sort {map_output_path} | {exe.name} > {map_output_path}")
+        with open(sorted_path, 'w', encoding='utf-8') as sortedfile:
+            subprocess.run(
+                ["sort", str(map_output_path)],
+                check=True,
+                stdout=sortedfile,
+                env={'LC_ALL': 'C.UTF-8'},
+            )
+        with open(sorted_path, encoding='utf-8') as infile,\
+             open(map_output_path, 'w', encoding='utf-8') as outfile:
+            subprocess.run(
+                str(exe),
+                shell=True,
+                check=True,
+                stdin=infile,
+                stdout=outfile,
+            )
+        sorted_path.unlink()
+
+
 def group_stage_cat_sort(input_dir, sorted_output_filename):
     """Concatenate and sort input files, saving to 'sorted_ouput_filename'.
 
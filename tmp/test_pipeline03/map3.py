@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+
+Map 3.
+reduced_id  term_1  doc_id  tf_ik  norm  idf_k
+reduced_id  term_2  doc_id  tf_ik  norm  idf_k
+One line per posting.  Totally 3 reduced_id's.
+Sorting whole lines sorts each segment by (term, doc_id), so reduce3 can
+stream its input.
+"""
+import sys
+
+
+NUM_REDUCE_TASKS = 3
+
+for line in sys.stdin:
+    doc_id, norm, *term_list = line.rstrip("\n").split("\t")
+    reduced_id = int(doc_id) % NUM_REDUCE_TASKS
+    for i in range(0, len(term_list), 3):
+        term, tf_ik, idf_k = term_list[i:i + 3]
+        print(f"{reduced_id}\t{term}\t{doc_id}\t{tf_ik}\t{norm}\t{idf_k}")
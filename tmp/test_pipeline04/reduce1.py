@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+
+Reduce 1.
+term1  doc_id_1  freq_1  doc_id_2  freq_2  ...
+term2  doc_id_1  freq_1  doc_id_2  freq_2  ...
+Note that term is unique.  Fields are separated by tabs.
+"""
+import sys
+import itertools
+
+
+def reduce_one_group(key, group):
+    term_freq_per_term = {}
+    for line in group:
+        _, doc_id, tf_ik = line.strip().split("\t")
+        doc_id = doc_id.strip()
+        if doc_id in term_freq_per_term:
+            term_freq_per_term[doc_id] += int(tf_ik)
+        else:
+            term_freq_per_term[doc_id] = int(tf_ik)
+    term_freq_per_term_str = "\t".join(
+        f"{doc_id}\t{tf_ik}" for doc_id, tf_ik in term_freq_per_term.items()
+    )
+    print(f"{key}\t{term_freq_per_term_str}")
+
+
+def keyfunc(line):
+    return line.partition("\t")[0]
+
+
+def main():
+    for key, group in itertools.groupby(sys.stdin, keyfunc):
+        reduce_one_group(key, group)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+
+Reduce 3.
+term1 idf_k doc_id tf_ik norm doc_id tf_ik norm ...
+term2 idf_k doc_id tf_ik norm ...
+Input lines are sorted by (reduced_id, term, doc_id), so each term's line is
+written as soon as its group ends and memory does not grow with the segment.
+Set REDUCE3_EXTERNAL_SORT=1 when the input is not sorted that way: it is then
+sorted in runs of REDUCE3_RUN_LINES lines spilled to temporary files, which
+are merged.
+"""
+import sys
+import os
+import heapq
+import itertools
+import tempfile
+import contextlib
+
+
+EXTERNAL_SORT = os.environ.get("REDUCE3_EXTERNAL_SORT", "0") != "0"
+RUN_LINES = int(os.environ.get("REDUCE3_RUN_LINES", "1000000"))
+
+
+def external_sort(lines, tmpdir, stack):
+    # Sort runs of lines in memory, spill them and merge the sorted files
+    run_files = []
+    while True:
+        run = sorted(itertools.islice(lines, RUN_LINES))
+        if not run:
+            break
+        run_file = stack.enter_context(tempfile.TemporaryFile(
+            "w+", encoding="utf-8", dir=tmpdir
+        ))
+        run_file.writelines(run)
+        run_file.seek(0)
+        run_files.append(run_file)
+    return heapq.merge(*run_files)
+
+
+def check_sorted(lines):
+    prev_line = ""
+    for line in lines:
+        if line < prev_line:
+            sys.exit(
+                "reduce3: input is not sorted by (term, doc_id), "
+                "set REDUCE3_EXTERNAL_SORT=1"
+            )
+        prev_line = line
+        yield line
+
+
+def output_one_group(term, group):
+    for i, line in enumerate(group):
+        _, _, doc_id, tf_ik, norm, idf_k = line.rstrip("\n").split("\t")
+        if i == 0:
+            sys.stdout.write(f"{term} {idf_k}")
+        sys.stdout.write(f" {doc_id} {tf_ik} {norm}")
+    sys.stdout.write("\n")
+
+
+def keyfunc(line):
+    return line.split("\t", 2)[:2]
+
+
+def main():
+    with contextlib.ExitStack() as stack:
+        lines = sys.stdin
+        if EXTERNAL_SORT:
+            tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+            lines = external_sort(lines, tmpdir, stack)
+        else:
+            lines = check_sorted(lines)
+        for (_, term), group in itertools.groupby(lines, keyfunc):
+            output_one_group(term, group)
+
+
+if __name__ == "__main__":
+    main()
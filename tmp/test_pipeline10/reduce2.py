@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+
+Reduce 2.
+doc_id1  norm  term1  tf_ik  idf_k  term2  tf_ik  idf_k  ...
+doc_id2  norm  term2  tf_ik  idf_k  term4  tf_ik  idf_k  ...
+Note that doc_id is unique.  Fields are separated by tabs.
+"""
+import sys
+import itertools
+
+
+def reduce_one_group(key, group):
+    # Output each document as soon as its group ends, so only the current
+    # document is held in memory
+    norm = 0.0
+    term_list = []
+    for line in group:
+        _, term, tf_ik, idf_k = line.rstrip("\n").split("\t")
+        w_ik = int(tf_ik) * float(idf_k)
+        norm += pow(w_ik, 2)
+        term_list.append(f"{term}\t{tf_ik}\t{idf_k}")
+    term_list_str = "\t".join(term_list)
+    print(f"{key}\t{norm}\t{term_list_str}")
+
+
+def keyfunc(line):
+    return line.partition("\t")[0]
+
+
+def main():
+    for key, group in itertools.groupby(sys.stdin, keyfunc):
+        reduce_one_group(key, group)
+
+
+if __name__ == "__main__":
+    main()
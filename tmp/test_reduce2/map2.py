@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+
+Map 2.
+doc_id_1  term_1  tf_ik  idf_k
+doc_id_2  term_2  tf_ik  idf_k
+doc_id_2  term_1  tf_ik  idf_k
+Note that doc_id is not unique.  Fields are separated by tabs.
+"""
+import sys
+import math
+
+
+DOC_COUNT = None
+
+txt_name = "total_document_count.txt"
+with open(txt_name, 'r') as countfile:
+    count_doc = countfile.readline().strip()
+    DOC_COUNT = int(count_doc)
+
+
+for line in sys.stdin:
+    term, *term_freq_per_doc = line.rstrip("\n").split("\t")
+    doc_ids = term_freq_per_doc[0::2]
+    tf_iks = term_freq_per_doc[1::2]
+    n_k = len(doc_ids)
+    idf_k = math.log(DOC_COUNT / n_k, 10)
+    for doc_id, tf_ik in zip(doc_ids, tf_iks):
+        print(f"{doc_id}\t{term}\t{tf_ik}\t{idf_k}")